@@ -0,0 +1,64 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from persistence.database import DatabaseManager
+from persistence.encryption import Encryption
+from security.audit import audit_vault
+from security.utils import generate_password
+from common import build_word_set, random_word
+
+
+def build_vault(directory, entries, words, rng, reuse_ratio=0.1, dictionary_ratio=0.05):
+    db = DatabaseManager(os.path.join(directory, 'vault.db'))
+    encryption = Encryption(db)
+    encryption.password = 'benchmark master password'
+    passwords = []
+    for _ in range(entries):
+        draw = rng.random()
+        if passwords and draw < reuse_ratio:
+            passwords.append(rng.choice(passwords))
+        elif draw < reuse_ratio + dictionary_ratio:
+            passwords.append(rng.choice(words))
+        else:
+            passwords.append(generate_password(rng.randint(6, 20)))
+    rows = (DatabaseManager.ROW_TUPLE(f"entry {i}", f"user{i}@example.com", password, f"https://site{i}.example")
+            for i, password in enumerate(passwords))
+    db.import_many(rows, encrypt=encryption.encrypt)
+    return db, encryption
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time a full vault audit on a synthetic vault")
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--words', type=int, default=200000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        words = [random_word(rng) for _ in range(args.words)]
+        word_set = build_word_set(directory, words)
+        db, encryption = build_vault(directory, args.entries, words, rng)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            report = audit_vault(db, encryption, word_set=word_set, workers=args.workers)
+            timings.append(time.perf_counter() - start)
+        word_set.close()
+        db.close()
+    print(f"{args.entries} entries, {args.words} dictionary words: best {min(timings):.3f}s, "
+          f"worst {max(timings):.3f}s over {args.repeat} runs")
+    print(f"{len(report.weak)} weak, {len(report.reused)} reused groups, "
+          f"{len(report.in_dictionary)} in dictionary, {len(report.undecryptable)} undecryptable")
+
+
+if __name__ == '__main__':
+    main()
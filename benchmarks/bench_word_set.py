@@ -0,0 +1,46 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import build_word_set, random_word
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batched and per-item word set lookups")
+    parser.add_argument('--words', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--hit-ratio', type=float, default=0.5)
+    parser.add_argument('--front-coded', action='store_true')
+    parser.add_argument('--no-bloom', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        words = [random_word(rng) for _ in range(args.words)]
+        word_set = build_word_set(directory, words, bloom=not args.no_bloom, front_coded=args.front_coded)
+        print(f"{type(word_set).__name__} of {word_set.word_count} words, bloom {'off' if args.no_bloom else 'on'}")
+        for count in args.queries:
+            queries = [rng.choice(words) if rng.random() < args.hit_ratio else random_word(rng) for _ in range(count)]
+            single_time, single = timed(lambda: [query in word_set for query in queries])
+            batch_time, batch = timed(word_set.contains_many, queries)
+            rank_time, _ = timed(word_set.rank_many, queries)
+            assert single == batch
+            print(f"{count:>8} queries: per item {single_time:.3f}s, contains_many {batch_time:.3f}s "
+                  f"({single_time / batch_time:.1f}x), rank_many {rank_time:.3f}s")
+        word_set.close()
+
+
+if __name__ == '__main__':
+    main()
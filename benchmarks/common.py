@@ -0,0 +1,20 @@
+import os
+import string
+
+from security.word_set import open_word_set, prepare_wordset
+
+WORD_ALPHABET = string.ascii_lowercase + string.digits
+
+
+def random_word(rng, min_length=9, max_length=16):
+    return ''.join(rng.choice(WORD_ALPHABET) for _ in range(rng.randint(min_length, max_length)))
+
+
+def build_word_set(directory, words, name='words', min_length=9, max_length=16, **kwargs):
+    # writes the words as a text list next to the set, like the bundled dictionary is prepared
+    text_path = os.path.join(directory, f"{name}.txt")
+    with open(text_path, 'w') as f:
+        f.write('\n'.join(words))
+    path = os.path.join(directory, f"{name}.ws")
+    prepare_wordset(text_path, path, min_length=min_length, max_length=max_length, **kwargs)
+    return open_word_set(path)
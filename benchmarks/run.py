@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from persistence import kdf
+from persistence.database import DatabaseManager
+from persistence.encryption import Encryption
+from security.strength import compute_password_strength
+from security.time_cracker import number_results
+from security.utils import generate_password, generate_random_string
+from common import build_word_set, random_word
+
+SIZES = (1000, 10000, 100000)
+TOLERANCE = 0.25
+REPEAT = 3
+SAMPLE_SIZE = 1000 # operations timed by the per-item benchmarks
+WORD_COUNT = 100000
+CHARSETS = (string.ascii_lowercase, string.ascii_uppercase, string.digits, string.punctuation)
+
+
+def synthetic_rows(rng, count, prefix='entry'):
+    for i in range(count):
+        yield DatabaseManager.ROW_TUPLE(f"{prefix} {i}", f"{random_word(rng, 4, 10)}@example.com",
+                                        generate_password(rng.randint(8, 24)), f"https://{random_word(rng, 4, 12)}.example")
+
+
+def time_best(func, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Suite:
+    def __init__(self, directory, repeat=REPEAT, sample_size=SAMPLE_SIZE, only=None, seed=0):
+        self.directory = directory
+        self.repeat = repeat
+        self.sample_size = sample_size
+        self.only = only
+        self.rng = random.Random(seed)
+        self.results = {}
+
+    def record(self, name, func, operations, setup=None, repeat=None):
+        if self.only is not None and not any(pattern in name for pattern in self.only):
+            return
+        seconds = time_best(func, repeat or self.repeat, setup)
+        self.results[name] = {'seconds': seconds, 'operations': operations, 'per_operation': seconds / operations}
+        print(f"{name:<48} {seconds:>10.4f}s {seconds / operations * 1e6:>12.2f}us/op", file=sys.stderr)
+
+    def build_vault(self, size):
+        db = DatabaseManager(os.path.join(self.directory, f"vault_{size}.db"))
+        encryption = Encryption(db)
+        # fixed parameters, a calibrated KDF would make unlock timings depend on the host by design
+        encryption.update_password('benchmark master password', kdf_params=kdf.DEFAULT_KDF_PARAMS)
+        db.import_many(synthetic_rows(self.rng, size), encrypt=encryption.encrypt)
+        return db, encryption
+
+    def run_vault(self, size):
+        db, encryption = self.build_vault(size)
+        sample = self.rng.sample(range(size), min(size, self.sample_size))
+        names = [f"entry {i}" for i in sample]
+        new_rows = [row._replace(password=encryption.encrypt(row.password))
+                    for row in synthetic_rows(self.rng, len(sample), prefix='new')]
+
+        def _submit():
+            for row in new_rows:
+                db.submit(row)
+
+        def _remove_new_rows():
+            with db.cursor() as cursor:
+                cursor.executemany("DELETE FROM manager WHERE name = ?", [(row.name,) for row in new_rows])
+            db.invalidate_cache()
+
+        self.record(f"db.submit[{size}]", _submit, len(new_rows), setup=_remove_new_rows)
+        _remove_new_rows()
+        self.record(f"db.fetch_all[{size}]", lambda: list(db.fetch_all()), size)
+        db.fetch_one(names[0]) # warms the row cache, like the table view does on startup
+        self.record(f"db.fetch_one[{size}]", lambda: [db.fetch_one(name) for name in names], len(names))
+        self.record(f"db.exists[{size}]", lambda: [db.exists(name) for name in names], len(names))
+
+        def _decrypt(data):
+            return encryption.decrypt(data).encode()
+
+        def _encrypt(data):
+            return encryption.encrypt(data.decode())
+
+        self.record(f"db.recipher[{size}]", lambda: db.recipher(decrypt=_decrypt, encrypt=_encrypt), size,
+                    repeat=1 if size >= 100000 else None)
+
+        self.run_table_search(db, size)
+        db.close()
+
+    def run_table_search(self, db, size):
+        # the only benchmark needing Tk, the rest of the suite still runs on hosts without it
+        try:
+            from ui.table_view import TableView
+        except ImportError as e:
+            print(f"TableView.match_search_string[{size}] skipped: {e}", file=sys.stderr)
+            return
+        plain_rows = [(row.name, row.email, row.website) for row in db.fetch_all()]
+        queries = [random_word(self.rng, 1, 4) + ' ' + random_word(self.rng, 1, 3) for _ in range(10)]
+        self.record(f"TableView.match_search_string[{size}]",
+                    lambda: [TableView.match_search_string(query, row) for query in queries for row in plain_rows],
+                    len(queries) * len(plain_rows))
+
+    def run_crypto(self, size=SAMPLE_SIZE):
+        db = DatabaseManager(os.path.join(self.directory, "crypto.db"))
+        encryption = Encryption(db)
+        encryption.update_password('benchmark master password', kdf_params=kdf.DEFAULT_KDF_PARAMS)
+        passwords = [generate_password(self.rng.randint(8, 24)) for _ in range(size)]
+        sealed = [encryption.encrypt(password) for password in passwords]
+        self.record("Encryption.encrypt", lambda: [encryption.encrypt(password) for password in passwords], size)
+        self.record("Encryption.decrypt", lambda: [encryption.decrypt(data) for data in sealed], size)
+        db.close()
+
+    def run_strength(self, size=SAMPLE_SIZE):
+        passwords = [generate_random_string(self.rng.randint(4, 32), self.rng.sample(CHARSETS, self.rng.randint(1, 4)))
+                     for _ in range(size)]
+        self.record("number_results", lambda: [number_results(password) for password in passwords], size)
+        self.record("compute_password_strength",
+                    lambda: [compute_password_strength(password) for password in passwords], size)
+        self.record("generate_random_string", lambda: [generate_random_string(16, CHARSETS) for _ in range(size)], size)
+
+    def run_word_set(self, size=SAMPLE_SIZE, word_count=WORD_COUNT):
+        words = [random_word(self.rng) for _ in range(word_count)]
+        for front_coded in (False, True):
+            word_set = build_word_set(self.directory, words, name=f"words_{int(front_coded)}", front_coded=front_coded)
+            queries = [self.rng.choice(words) if self.rng.random() < 0.5 else random_word(self.rng) for _ in range(size)]
+            label = type(word_set).__name__
+            self.record(f"{label}.__contains__", lambda: [query in word_set for query in queries], size)
+            self.record(f"{label}.contains_many", lambda: word_set.contains_many(queries), size)
+            word_set.close()
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"{name:<48} no baseline")
+            continue
+        ratio = result['per_operation'] / reference['per_operation']
+        status = "REGRESSION" if ratio > 1 + tolerance else "ok"
+        print(f"{name:<48} {ratio:>7.2f}x baseline  {status}")
+        if status != "ok":
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmarks of the persistence, crypto and strength hot paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="synthetic vault sizes, in rows")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="runs per benchmark, the best one is kept")
+    parser.add_argument('--only', nargs='+', help="only run benchmarks whose name contains one of these")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="results of a previous run to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="allowed slowdown, 0.25 means 25%%")
+    parser.add_argument('--write-baseline', action='store_true', help="store this run as the baseline instead of comparing")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.write_baseline and args.baseline is None:
+        parser.error("--write-baseline needs --baseline")
+
+    with tempfile.TemporaryDirectory() as directory:
+        suite = Suite(directory, repeat=args.repeat, only=args.only, seed=args.seed)
+        suite.run_crypto()
+        suite.run_strength()
+        suite.run_word_set()
+        for size in args.sizes:
+            suite.run_vault(size)
+
+    report = {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'time': time.time(),
+                 'sizes': args.sizes, 'repeat': args.repeat},
+        'results': suite.results,
+    }
+    with open(args.baseline if args.write_baseline else args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    if args.baseline is None or args.write_baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    regressions = compare(suite.results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
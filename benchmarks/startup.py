@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# modules main.py leaves out of the startup path, their import time is reported apart
+DEFERRED_MODULES = ('captcha.image', 'PIL.ImageTk', 'ttkthemes')
+RUNS = 5
+TOP = 25
+
+# started in a vault directory, prints the wall clock time once the unlock dialog is mapped and exits
+PROMPT_PROBE = """
+import os, sys, time
+sys.path.insert(0, {root!r})
+import ui.window
+wait_visibility = ui.window.Window.wait_visibility
+def _report(self, *args):
+    wait_visibility(self, *args)
+    self.update_idletasks()
+    print(time.time(), flush=True)
+    os._exit(0)
+ui.window.Window.wait_visibility = _report
+import main
+main.main()
+"""
+
+
+def import_times(statement):
+    # -X importtime writes "import time: self [us] | cumulative | imported package" lines to stderr
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own) / 1e6, int(cumulative) / 1e6)
+    return times
+
+
+def print_import_times(title, times, top):
+    print(f"{title}: {sum(own for own, _ in times.values()):.3f}s over {len(times)} modules")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for name, (own, cumulative) in sorted(times.items(), key=lambda item: -item[1][1])[:top]:
+        print(f"{cumulative:>11.4f}s {own:>9.4f}s  {name}")
+
+
+def prepare_vault(directory):
+    from persistence import kdf
+    from persistence.database import DatabaseManager
+    from persistence.encryption import Encryption
+    db = DatabaseManager(os.path.join(directory, "passmanager.db"))
+    Encryption(db).update_password('startup benchmark', kdf_params=kdf.DEFAULT_KDF_PARAMS)
+    db.close()
+
+
+def time_to_prompt(runs):
+    timings = []
+    with tempfile.TemporaryDirectory() as directory:
+        prepare_vault(directory)
+        for _ in range(runs):
+            start = time.time()
+            process = subprocess.run([sys.executable, '-c', PROMPT_PROBE.format(root=ROOT)], cwd=directory,
+                                     capture_output=True, text=True, timeout=60)
+            if process.returncode != 0 or not process.stdout.strip():
+                raise RuntimeError(process.stderr.strip() or "the unlock dialog never showed up")
+            timings.append(float(process.stdout.split()[-1]) - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup report: import time breakdown and time to the unlock prompt")
+    parser.add_argument('--runs', type=int, default=RUNS, help="application launches timed, the median is reported")
+    parser.add_argument('--top', type=int, default=TOP, help="modules listed in the import breakdown")
+    parser.add_argument('--output', help="also write the report as JSON to this path")
+    args = parser.parse_args()
+
+    startup = import_times("import main")
+    deferred = {name: times for name, times in import_times("import " + ", ".join(DEFERRED_MODULES)).items()
+                if name not in startup}
+    print_import_times("import main", startup, args.top)
+    print()
+    print_import_times("deferred until needed", deferred, args.top)
+    report = {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'time': time.time()},
+        'import_seconds': sum(own for own, _ in startup.values()),
+        'deferred_import_seconds': sum(own for own, _ in deferred.values()),
+        'imports': {name: {'self': own, 'cumulative': cumulative} for name, (own, cumulative) in startup.items()},
+    }
+
+    print()
+    if os.environ.get('DISPLAY') or sys.platform in ('win32', 'darwin'):
+        timings = time_to_prompt(args.runs)
+        report['time_to_prompt'] = {'median': statistics.median(timings), 'min': min(timings), 'max': max(timings)}
+        print(f"time to unlock prompt: median {statistics.median(timings):.3f}s, "
+              f"best {min(timings):.3f}s, worst {max(timings):.3f}s over {args.runs} launches")
+    else:
+        print("time to unlock prompt: skipped, no display")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import sys
+
+# heavy modules (cryptography, the strength dictionary) are imported by the commands that need them,
+# so listing entries never pays for them and nothing here touches tkinter
+
+DEFAULT_DB = "passmanager.db"
+PASSWORD_ENV = 'PASSWORD_MANAGER_PASSWORD'
+PASSPHRASE_ENV = 'PASSWORD_MANAGER_BACKUP_PASSPHRASE'
+
+
+class CommandError(Exception):
+    pass
+
+
+def _open_db(args):
+    from persistence.database import DatabaseManager
+    if not os.path.exists(args.db):
+        raise CommandError(f"No vault at {args.db}")
+    # a single command reads a handful of rows, filling the row cache would cost more than it saves
+    return DatabaseManager(args.db, row_cache_budget=None)
+
+
+def _master_password(prompt="Master password: "):
+    password = os.environ.get(PASSWORD_ENV)
+    if password is None:
+        import getpass
+        password = getpass.getpass(prompt)
+    return password
+
+
+def _unlock(db, migrate=False):
+    from persistence.encryption import Encryption
+    if not db.has_master_pwd():
+        raise CommandError("The vault has no master password yet, set one from the application first")
+    encryption = Encryption(db)
+    if not encryption.unlock(_master_password(), migrate=migrate):
+        raise CommandError("Invalid master password")
+    return encryption
+
+
+def _check_master_password(db):
+    if not db.has_master_pwd() or not db.check_master_pwd(_master_password()):
+        raise CommandError("Invalid master password")
+
+
+def _entry_password(args, required):
+    if args.generate is not None:
+        from security.utils import generate_password
+        return generate_password(args.generate)
+    if args.password_stdin:
+        return sys.stdin.readline().rstrip('\n')
+    if required or args.prompt_password:
+        import getpass
+        password = getpass.getpass("Entry password: ")
+        if getpass.getpass("Confirm entry password: ") != password:
+            raise CommandError("Passwords don't match")
+        return password
+    return None
+
+
+def _fetch(db, name):
+    row = db.fetch_one(name)
+    if row is None:
+        raise CommandError(f"No entry named '{name}'")
+    return row
+
+
+def _check(result):
+    # the database reports refused changes with a falsy Error instead of raising
+    if not result:
+        raise CommandError(str(result))
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def _print_rows(args, rows, fields):
+    if args.json:
+        json.dump([{field: getattr(row, field) for field in fields} for row in rows], sys.stdout, indent=2)
+        print()
+    elif rows:
+        sys.stdout.write('\n'.join('\t'.join(getattr(row, field) for field in fields) for row in rows) + '\n')
+
+
+def command_list(args):
+    db = _open_db(args)
+    rows = db.fetch_page(0, -1, tuple(args.search)) # every match, newest first like the table view
+    _print_rows(args, rows, ('name', 'email', 'website'))
+
+
+def command_get(args):
+    db = _open_db(args)
+    row = _fetch(db, args.name)
+    if args.field == 'password' or args.field == 'all':
+        encryption = _unlock(db)
+        failed = []
+        password = encryption.decrypt(row.password, report_error_func=failed.append)
+        if failed:
+            raise CommandError(failed[0])
+        row = row._replace(password=password)
+    if args.field == 'all':
+        _print_rows(args, [row], row._fields)
+    elif args.json:
+        json.dump({args.field: getattr(row, args.field)}, sys.stdout)
+        print()
+    else:
+        print(getattr(row, args.field))
+
+
+def command_add(args):
+    db = _open_db(args)
+    if db.exists(args.name):
+        raise CommandError(f"An entry named '{args.name}' already exists")
+    encryption = _unlock(db, migrate=True)
+    password = _entry_password(args, required=True)
+    _check(db.submit(db.ROW_TUPLE(args.name, args.email or '', encryption.encrypt(password), args.website or '')))
+
+
+def command_update(args):
+    db = _open_db(args)
+    row = _fetch(db, args.name)
+    fields = {field: value for field, value in (('email', args.email), ('website', args.website)) if value is not None}
+    if args.generate is not None or args.password_stdin or args.prompt_password:
+        encryption = _unlock(db, migrate=True)
+        fields['password'] = encryption.encrypt(_entry_password(args, required=True))
+    else:
+        _check_master_password(db)
+    _check(db.update(row._replace(**fields)))
+
+
+def command_delete(args):
+    db = _open_db(args)
+    _fetch(db, args.name)
+    _check_master_password(db)
+    _check(db.delete(args.name))
+
+
+def _backup_passphrase(confirm):
+    passphrase = os.environ.get(PASSPHRASE_ENV)
+    if passphrase is None:
+        import getpass
+        passphrase = getpass.getpass("Backup passphrase: ")
+        if confirm and getpass.getpass("Confirm backup passphrase: ") != passphrase:
+            raise CommandError("Passphrases don't match")
+    return passphrase
+
+
+def command_import(args):
+    from persistence import backup, interchange
+    db = _open_db(args)
+    encryption = _unlock(db, migrate=True)
+    try:
+        if backup.is_backup(args.path):
+            report = backup.restore_backup(db, encryption, args.path, _backup_passphrase(confirm=False), on_conflict=args.on_conflict)
+        else:
+            report = interchange.import_file(db, encryption, args.path, on_conflict=args.on_conflict)
+    except (backup.BackupError, ValueError) as e:
+        raise CommandError(str(e))
+    print(f"{len(report.submitted)} added, {len(report.updated)} updated, {len(report.skipped)} skipped", file=sys.stderr)
+
+
+def command_export(args):
+    from persistence import backup
+    db = _open_db(args)
+    encryption = _unlock(db)
+    failures = []
+    exported = backup.export_backup(db, encryption, args.path, _backup_passphrase(confirm=True), report_error_func=failures.append)
+    print(f"{exported} entries exported to {args.path}", file=sys.stderr)
+    if failures:
+        raise CommandError(f"{len(failures)} entries could not be decrypted and were exported with an empty password")
+
+
+def command_audit(args):
+    from security.audit import audit_vault
+    from security.strength import pwd_strength_to_string
+    word_set = None
+    if args.wordlist is not None:
+        from security.word_set import open_word_set
+        word_set = open_word_set(args.wordlist)
+        if not word_set:
+            raise CommandError(f"Cannot read the word list {args.wordlist}")
+    db = _open_db(args)
+    report = audit_vault(db, _unlock(db), word_set=word_set)
+    if args.json:
+        json.dump(report._asdict() | {'entries': [entry._asdict() for entry in report.entries]}, sys.stdout, indent=2)
+        print()
+        return
+    for entry in sorted(report.entries, key=lambda entry: entry.strength):
+        notes = []
+        if entry.in_dictionary:
+            notes.append("common password")
+        if entry.reused_with:
+            notes.append("also used by " + ', '.join(entry.reused_with))
+        strength = pwd_strength_to_string(entry.strength - 1) if entry.strength else "Empty"
+        print('\t'.join((entry.name, strength, '; '.join(notes))).rstrip())
+    for name in report.undecryptable:
+        print(f"{name}\tcannot be decrypted")
+    print(f"{len(report.weak)} weak, {len(report.reused)} reused groups, {len(report.in_dictionary)} common, "
+          f"{len(report.undecryptable)} undecryptable out of {len(report.entries) + len(report.undecryptable)}", file=sys.stderr)
+
+
+def _add_password_options(parser, prompt_option):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--generate', type=_positive_int, metavar='LENGTH', help="use a random password of this length")
+    group.add_argument('--password-stdin', action='store_true', help="read the entry password from the first line of stdin")
+    if prompt_option:
+        group.add_argument('--prompt-password', action='store_true', help="ask for a new entry password")
+    else:
+        parser.set_defaults(prompt_password=False)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Password manager without the user interface. The master password is "
+                                                 f"read from ${PASSWORD_ENV} when set, otherwise it is asked for.")
+    parser.add_argument('--db', default=DEFAULT_DB, help=f"vault to use (default: {DEFAULT_DB})")
+    parser.add_argument('--json', action='store_true', help="machine readable output")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('list', help="list entries, without their passwords")
+    command.add_argument('search', nargs='*', help="only entries where every token is in the name, email or website")
+    command.set_defaults(func=command_list)
+
+    command = commands.add_parser('get', help="print one field of an entry")
+    command.add_argument('name')
+    command.add_argument('--field', choices=('password', 'email', 'website', 'all'), default='password')
+    command.set_defaults(func=command_get)
+
+    command = commands.add_parser('add', help="add an entry")
+    command.add_argument('name')
+    command.add_argument('--email')
+    command.add_argument('--website')
+    _add_password_options(command, prompt_option=False)
+    command.set_defaults(func=command_add)
+
+    command = commands.add_parser('update', help="change fields of an entry")
+    command.add_argument('name')
+    command.add_argument('--email')
+    command.add_argument('--website')
+    _add_password_options(command, prompt_option=True)
+    command.set_defaults(func=command_update)
+
+    command = commands.add_parser('delete', help="delete an entry")
+    command.add_argument('name')
+    command.set_defaults(func=command_delete)
+
+    command = commands.add_parser('import', help="import a CSV, JSON or JSON lines file, or restore a backup")
+    command.add_argument('path')
+    command.add_argument('--on-conflict', choices=('skip', 'overwrite', 'rename'), default='skip')
+    command.set_defaults(func=command_import)
+
+    command = commands.add_parser('export', help=f"write an encrypted backup, its passphrase is read from ${PASSPHRASE_ENV} when set")
+    command.add_argument('path')
+    command.set_defaults(func=command_export)
+
+    command = commands.add_parser('audit', help="report weak, reused and common passwords")
+    command.add_argument('--wordlist', help="word set to check passwords against instead of the bundled one")
+    command.set_defaults(func=command_audit)
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except CommandError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    except OSError as e:
+        print(f"error: {e.strerror or e}: {e.filename}" if e.filename else f"error: {e}", file=sys.stderr)
+        return 1
+    except EOFError:
+        print("error: no input", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print(file=sys.stderr)
+        return 130
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import atexit
+import functools
+import importlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+
+ENV_VAR = 'PASSWORD_MANAGER_INSTRUMENT' # path of the JSON dump, or 1 for the default one
+FLAG = '--instrument' # --instrument or --instrument=PATH
+DEFAULT_OUTPUT = 'instrumentation.json'
+
+# (module, class, attribute), a class of None patches a module level function, which only works for
+# callers looking it up on the module at call time. ui modules are only patched when the application
+# already imported them, so headless tools don't pull in tkinter just for being measured
+TARGETS = (
+    ('persistence.database', 'Cursor', '__enter__'),
+    ('persistence.database', 'Cursor', 'execute'),
+    ('persistence.database', 'Cursor', 'executemany'),
+    ('persistence.database', 'Cursor', 'fetch'),
+    ('persistence.database', 'Cursor', 'fetch_many'),
+    ('persistence.database', 'DatabaseManager', '_notify'),
+    ('persistence.kdf', None, 'derive'), # every unlock and password change, callers go through kdf.derive
+    ('persistence.encryption', 'FernetPasswordCipher', '_derive_key'), # legacy records sealed with their own salt
+    ('security.word_set', 'WordSet', '__contains__'),
+    ('security.word_set', 'FrontCodedWordSet', '__contains__'),
+    ('ui.table_view', 'TableView', 'filter_by_search_string'),
+    ('ui.virtual_table_view', 'VirtualTableView', 'filter_by_search_string'),
+)
+HEADLESS_PACKAGES = ('persistence', 'security')
+
+
+class Histogram:
+    # latencies bucketed by powers of two nanoseconds, bucket k holds [2^(k-1), 2^k)
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = {}
+
+    def add(self, nanoseconds):
+        self.count += 1
+        self.total += nanoseconds
+        self.max = max(self.max, nanoseconds)
+        bucket = nanoseconds.bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_seconds': self.total / 1e9,
+            'mean_seconds': self.total / self.count / 1e9 if self.count else 0,
+            'max_seconds': self.max / 1e9,
+            'log2_ns_buckets': {str(bucket): count for bucket, count in sorted(self.buckets.items())},
+        }
+
+
+_histograms = {}
+_lock = threading.Lock()
+_originals = []
+_output = None
+_dump_registered = False
+
+
+def record(name, nanoseconds):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(nanoseconds)
+
+
+def _timed(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter_ns() - start)
+    return wrapper
+
+
+def _timed_iteration(name, func):
+    # a generator only runs while it is consumed, so the time spent producing every item is summed up
+    # and recorded once the iteration ends, the consumer's own work in between is left out
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        iterator = func(*args, **kwargs)
+        elapsed = 0
+        try:
+            while True:
+                start = time.perf_counter_ns()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter_ns() - start
+                yield item
+        finally:
+            iterator.close()
+            record(name, elapsed)
+    return wrapper
+
+
+def _timed_notify(name, func):
+    # one histogram per event, the fan-out to every callback is what gets measured
+    @functools.wraps(func)
+    def wrapper(self, event, *args):
+        start = time.perf_counter_ns()
+        try:
+            return func(self, event, *args)
+        finally:
+            record(f"{name}.{event}", time.perf_counter_ns() - start)
+    return wrapper
+
+
+def _patch(module_name, class_name, attribute):
+    if module_name.split('.')[0] in HEADLESS_PACKAGES:
+        module = importlib.import_module(module_name)
+    else:
+        module = sys.modules.get(module_name)
+    owner = module if class_name is None else getattr(module, class_name, None)
+    if owner is None or attribute not in vars(owner):
+        return
+    original = vars(owner)[attribute]
+    name = f"{class_name or module_name.rpartition('.')[2]}.{attribute}"
+    if attribute == '_notify':
+        wrap = _timed_notify
+    elif inspect.isgeneratorfunction(original):
+        wrap = _timed_iteration
+    else:
+        wrap = _timed
+    setattr(owner, attribute, wrap(name, original))
+    _originals.append((owner, attribute, original))
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def _dump_on_exit():
+    if _output is not None:
+        dump(_output)
+
+
+def enable(output=DEFAULT_OUTPUT):
+    global _output, _dump_registered
+    if is_enabled():
+        return
+    for target in TARGETS:
+        _patch(*target)
+    _output = output
+    if not _dump_registered:
+        atexit.register(_dump_on_exit)
+        _dump_registered = True
+
+
+def disable():
+    global _output
+    while _originals:
+        owner, attribute, original = _originals.pop()
+        setattr(owner, attribute, original)
+    _output = None
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def snapshot():
+    with _lock:
+        return {name: histogram.as_dict() for name, histogram in sorted(_histograms.items())}
+
+
+def dump(path):
+    with open(path, 'w') as f:
+        json.dump({'pid': os.getpid(), 'argv': sys.argv, 'time': time.time(), 'timings': snapshot()}, f, indent=2)
+
+
+def configure(argv):
+    # enables instrumentation from the environment or the command line, returns the arguments left for the application
+    output, remaining = os.environ.get(ENV_VAR), []
+    for argument in argv:
+        if argument == FLAG or argument.startswith(FLAG + '='):
+            output = argument.partition('=')[2] or '1'
+        else:
+            remaining.append(argument)
+    if output and output != '0':
+        enable(DEFAULT_OUTPUT if output == '1' else output)
+    return remaining
@@ -1,4 +1,6 @@
 import center_tk_window
+import instrumentation
+import sys
 import tkinter as tk
 import tkinter.simpledialog
 from tkinter import messagebox
@@ -6,14 +8,20 @@ from tkinter import messagebox
 from persistence.data import FIELDS
 from persistence.database import DatabaseManager
 from persistence.encryption import Encryption
+from security import strength
+from ui import captcha_
 from ui.entry import NamedEntry
 from ui.form import Form
 from functools import partial
 from ui.generate_password import GeneratePassword
 from ui.master_dialog import MasterDialogInit, MasterDialogChange, MasterDialogCheck
 from ui.table_view import TableView
+from ui.virtual_table_view import VirtualTableView
 from tkinter import ttk
-from ttkthemes import ThemedTk
+
+
+VIRTUAL_TABLE_THRESHOLD = 5000 # rows, above which only the visible window of the table is materialised
+THEME = "arc"
 
 
 def fill_layout(root, db, encryption):
@@ -40,11 +48,15 @@ def fill_layout(root, db, encryption):
 
     show_error = partial(messagebox.showerror, "Decryption failure")
     decrypt = partial(encryption.decrypt, report_error_func=show_error)
-    table = TableView(bottom, db, decrypt, on_select=form.load)
+    table_type = VirtualTableView if db.count() > VIRTUAL_TABLE_THRESHOLD else TableView
+    table = table_type(bottom, db, decrypt, on_select=form.load)
+    scrollbar = ttk.Scrollbar(bottom, orient=tk.VERTICAL, command=table.yview)
+    table.configure(yscrollcommand=scrollbar.set)
     
     searchvar = tk.StringVar()
-    searchvar.trace('w', lambda *args: table.filter_by_search_string(searchvar.get()))
+    searchvar.trace('w', lambda *args: table.search(searchvar.get()))
     NamedEntry(bottom, 'Search', width=61, textvariable=searchvar).pack()
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
     table.pack(fill=tk.BOTH, expand=True)
     
     
@@ -55,8 +67,14 @@ def fill_layout(root, db, encryption):
 
 
 
+def apply_theme(root, theme=THEME):
+    # ttkthemes pulls in PIL, it is only imported once the vault is unlocked
+    from ttkthemes import ThemedStyle
+    ThemedStyle(root).set_theme(theme)
+
+
 def make_root_window(width=500, height=700):
-    root = ThemedTk(theme="arc")
+    root = tk.Tk()
     root.title("Password Manager")
     root.geometry(f'{width}x{height}')
     root.minsize(480, 300)
@@ -64,19 +82,25 @@ def make_root_window(width=500, height=700):
 
 
 def main():
+    instrumentation.configure(sys.argv[1:])
     db = DatabaseManager("passmanager.db")
     root = make_root_window()
     
     center_tk_window.center_on_screen(root)
     
     encryption = Encryption(db)
-    fill_layout(root, db, encryption)
-
+    # the unlock prompt comes first, what it doesn't need is loaded meanwhile or once the vault is open
+    strength.warm_up_common_passwords()
     if db.has_master_pwd():
+        captcha_.preload()
         MasterDialogCheck(root, db, encryption)
     else:
         MasterDialogInit(root, db, encryption)
+    if not encryption.password: # cancelled, the root window is gone
+        return
 
+    apply_theme(root)
+    fill_layout(root, db, encryption)
     root.mainloop()
 
 if __name__ == '__main__':
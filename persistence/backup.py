@@ -0,0 +1,142 @@
+import base64
+import collections
+import itertools
+import json
+import os
+import struct
+
+from concurrent.futures import ThreadPoolExecutor
+
+import cryptography.fernet
+
+from persistence import kdf
+from persistence.interchange import record_to_row
+
+MAGIC = b'PMBACKUP2\n'
+LEGACY_MAGIC = b'PMBACKUP1\n' # only stored PBKDF2 iterations, still restored
+SALT_LENGTH = 32
+CHUNK_ROWS = 256
+_UINT32 = struct.Struct('>I')  # the byte length before every chunk, and the legacy kdf iterations
+_KDF_HEADER = struct.Struct('>16sII')  # kdf algorithm, iterations, memory cost
+_CHUNK_HEADER = struct.Struct('>QB')  # chunk index, is last chunk
+
+
+class BackupError(Exception):
+    pass
+
+
+def derive_backup_key(passphrase, salt, kdf_params=kdf.DEFAULT_KDF_PARAMS):
+    return base64.urlsafe_b64encode(kdf.derive(passphrase, salt, kdf_params))
+
+
+def is_backup(path):
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) in (MAGIC, LEGACY_MAGIC)
+
+
+def _read_kdf_params(file, magic):
+    header = _UINT32 if magic == LEGACY_MAGIC else _KDF_HEADER
+    data = file.read(header.size)
+    if len(data) < header.size:
+        raise BackupError("Backup is truncated")
+    if magic == LEGACY_MAGIC:
+        iterations, = header.unpack(data)
+        return kdf.DEFAULT_KDF_PARAMS._replace(iterations=iterations)
+    algorithm, iterations, memory_cost = header.unpack(data)
+    return kdf.KDF_PARAMS(algorithm.rstrip(b'\0').decode('ascii', errors='replace'), iterations, memory_cost)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_backup(db, encryption, path, passphrase, chunk_rows=CHUNK_ROWS, workers=None,
+                  kdf_params=None, progress=None, report_error_func=print):
+    # like the master password, the passphrase gets parameters calibrated for this host unless they are given
+    if kdf_params is None:
+        kdf_params = kdf.calibrate()
+    salt = os.urandom(SALT_LENGTH)
+    backup = cryptography.fernet.Fernet(derive_backup_key(passphrase, salt, kdf_params))
+
+    def _seal_chunk(index, rows, is_last=False):
+        lines = (json.dumps({
+            'name': row.name,
+            'email': row.email,
+            'password': encryption.decrypt(row.password, report_error_func),
+            'website': row.website,
+        }) for row in rows)
+        payload = _CHUNK_HEADER.pack(index, is_last) + '\n'.join(lines).encode('utf-8')
+        return backup.encrypt(payload)
+
+    def _write(token):
+        file.write(_UINT32.pack(len(token)) + token)
+
+    exported, temp_path = 0, path + '.tmp'
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+    with open(temp_path, 'wb') as file, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backup") as pool:
+        file.write(MAGIC + salt + _KDF_HEADER.pack(kdf_params.algorithm.encode('ascii'), kdf_params.iterations,
+                                                   kdf_params.memory_cost))
+        pending = collections.deque()
+        index = 0
+        for index, rows in enumerate(_chunks(db.iter_rows(), chunk_rows)):
+            pending.append(pool.submit(_seal_chunk, index, rows))
+            exported += len(rows)
+            while len(pending) >= max_pending:
+                _write(pending.popleft().result())
+            if progress is not None:
+                progress(exported, None)
+        while pending:
+            _write(pending.popleft().result())
+        _write(_seal_chunk(index + 1 if exported else 0, (), is_last=True))
+    os.replace(temp_path, path)
+    return exported
+
+
+_background = None
+
+
+def export_backup_async(*args, **kwargs):
+    global _background
+    if _background is None:
+        _background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup-export")
+    return _background.submit(export_backup, *args, **kwargs)
+
+
+def read_backup(path, passphrase):
+    with open(path, 'rb') as file:
+        magic = file.read(len(MAGIC))
+        if magic not in (MAGIC, LEGACY_MAGIC):
+            raise BackupError(f"{path} is not a password manager backup")
+        salt = file.read(SALT_LENGTH)
+        kdf_params = _read_kdf_params(file, magic)
+        try:
+            kdf.check_params(kdf_params) # the header isn't authenticated, nothing is derived before it is checked
+        except ValueError as e:
+            raise BackupError(f"Invalid backup header: {e}") from None
+        backup = cryptography.fernet.Fernet(derive_backup_key(passphrase, salt, kdf_params))
+        for expected_index in itertools.count():
+            length = file.read(_UINT32.size)
+            if len(length) < _UINT32.size:
+                raise BackupError("Backup is truncated")
+            token = file.read(_UINT32.unpack(length)[0])
+            try:
+                payload = backup.decrypt(token)
+            except cryptography.fernet.InvalidToken:
+                raise BackupError("Wrong passphrase or corrupted backup") from None
+            index, is_last = _CHUNK_HEADER.unpack_from(payload)
+            if index != expected_index:
+                raise BackupError("Backup chunks are out of order")
+            if is_last:
+                return
+            for line in payload[_CHUNK_HEADER.size:].split(b'\n'):
+                if line:
+                    yield record_to_row(json.loads(line))
+
+
+def restore_backup(db, encryption, path, passphrase, **kwargs):
+    return db.import_many(read_backup(path, passphrase), encrypt=encryption.encrypt, **kwargs)
@@ -1,8 +1,16 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
+import itertools
 import sqlite3
 import os
+import sys
 import hashlib
+import hmac
+import threading
+import time
+
+from persistence import kdf
 
 class EmptyCM:
     def __enter__(self):
@@ -14,15 +22,70 @@ class EmptyCM:
 class CancelOperation(BaseException):
     pass
 
+class ConnectionPool:
+    DEFAULT_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -8192, # in KiB
+        'mmap_size': 64 * 1024 * 1024,
+    }
+    CACHED_STATEMENTS = 128
+
+    def __init__(self, path, pragmas=None, cached_statements=CACHED_STATEMENTS):
+        self.path = path
+        self.pragmas = dict(self.DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # one long-lived connection per thread, so its statement cache is reused between cursors
+        connection = sqlite3.connect(self.path, cached_statements=self.cached_statements, check_same_thread=False)
+        for pragma, value in self.pragmas.items():
+            if value is not None:
+                connection.execute(f"PRAGMA {pragma} = {value}")
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    def acquire(self):
+        local = self._local
+        if getattr(local, 'connection', None) is None:
+            local.connection, local.depth = self._connect(), 0
+        local.depth += 1
+        return local.connection, local.depth
+
+    def release(self):
+        self._local.depth -= 1
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
 class Cursor:
-    def __init__(self, path, name=''):
+    def __init__(self, connections, name='', on_rollback=None):
         self.name = name
-        self.path = path
+        self.connections = connections
+        self.on_rollback = on_rollback
         self._nesting = 0
 
     def __enter__(self):
         if not self._nesting:
-            self.connection = sqlite3.connect(self.path)
+            self.connection, depth = self.connections.acquire()
+            # a distinct cursor opened inside another one on the same thread shares its connection and gets a savepoint:
+            # a failure only rolls back the inner work, but what it did is only durable once the outermost cursor commits,
+            # and is rolled back with it. sqlite3 would only begin on the first write, so the outermost cursor begins
+            # explicitly, otherwise a savepoint opened after reads only would be its own transaction and commit on release
+            self._savepoint = f"cursor_{depth}" if depth > 1 else None
+            if self._savepoint is not None:
+                self.connection.execute(f"SAVEPOINT {self._savepoint}")
+            elif not self.connection.in_transaction:
+                self.connection.execute("BEGIN")
             self.cursor = self.connection.cursor()
         self._nesting += 1
         return self
@@ -30,9 +93,18 @@ class Cursor:
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self._nesting -= 1
         if not self._nesting:
-            if exc_type is None:
+            self.cursor.close()
+            self.connections.release()
+            if self._savepoint is not None:
+                if exc_type is not None:
+                    self.connection.execute(f"ROLLBACK TO {self._savepoint}")
+                self.connection.execute(f"RELEASE {self._savepoint}")
+            elif exc_type is None:
                 self.connection.commit()
-            self.connection.close()
+            else:
+                self.connection.rollback()
+            if exc_type is not None and self.on_rollback is not None:
+                self.on_rollback()
             if exc_type == CancelOperation:
                 return True
 
@@ -42,21 +114,45 @@ class Cursor:
 
     def execute(self, *args, **kwargs):
         return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self.cursor.executemany(*args, **kwargs)
     
     def fetch(self, *args, **kwargs):
         self.cursor.execute(*args, **kwargs)
         return self.cursor.fetchall()
 
+    def fetch_many(self, sql, parameters=(), batch_size=256):
+        cursor = self.connection.cursor() # own cursor, so statements run while iterating don't reset the scan
+        try:
+            cursor.execute(sql, parameters)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cursor.close()
+
 SALT_LENGTH=32
 def hash_password(pwd, salt):
     return hashlib.pbkdf2_hmac(
         'sha256',
         pwd.encode('utf-8'),
         salt,
-        100000, # It is recommended to use at least 100,000 iterations of SHA-256 
+        kdf.DEFAULT_KDF_PARAMS.iterations, # only checks hashes stored before the single-KDF unlock
         dklen=128 # Get a 128 byte key
     )
 
+MASTER_KEY_MAGIC = b'PMk1'
+def derive_master_keys(pwd, salt, kdf_params=kdf.DEFAULT_KDF_PARAMS):
+    # a single KDF output, then HKDF-Expand (RFC 5869) with distinct labels: the stored verifier
+    # reveals nothing about the vault key, and a guess still costs an attacker the full KDF
+    master_key = kdf.derive(pwd, salt, kdf_params)
+    verifier = hmac.digest(master_key, b'password-manager verifier\x01', 'sha256')
+    vault_key = hmac.digest(master_key, b'password-manager vault key\x01', 'sha256')
+    return verifier, vault_key
+
 class Error:
     def __init__(self, message=""):
         self.message = message
@@ -70,9 +166,47 @@ class Error:
     def __repr__(self):
         return f"Error(message={self.message})"
 
+class RowCache:
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self.size = 0
+        self._rows = {}
+
+    @staticmethod
+    def _row_size(row):
+        return sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, name):
+        return self._rows.get(name)
+
+    def put(self, row):
+        self.remove(row.name)
+        self._rows[row.name] = row
+        self.size += self._row_size(row)
+        return self.size <= self.memory_budget
+
+    def remove(self, name):
+        row = self._rows.pop(name, None)
+        if row is not None:
+            self.size -= self._row_size(row)
+
+
 class DatabaseManager:
-    def __init__(self, path):
+    ROW_CACHE_BUDGET = 32 * 1024 * 1024 # in bytes, None disables the cache
+    ROW_CACHE_DISK_CHECK_INTERVAL = 0.5 # in seconds
+
+    def __init__(self, path, pragmas=None, cached_statements=ConnectionPool.CACHED_STATEMENTS, row_cache_budget=ROW_CACHE_BUDGET):
         self.path = path
+        self._connections = ConnectionPool(path, pragmas, cached_statements)
+        self._row_cache_budget = row_cache_budget
+        self._row_cache = None
+        self._row_cache_version = None
         with self.cursor() as cursor:
             cursor.execute(""" CREATE TABLE IF NOT EXISTS manager (
                                 name text PRIMARY KEY,
@@ -82,51 +216,175 @@ class DatabaseManager:
                                 )
             """) # todo, build from FIELDS
             cursor.execute(""" CREATE TABLE IF NOT EXISTS master_pwd (hashed_password text)""")
+            cursor.execute(""" CREATE TABLE IF NOT EXISTS keyring (name text PRIMARY KEY, value blob)""")
+            cursor.execute(""" CREATE TABLE IF NOT EXISTS kdf_params (algorithm text, iterations integer, memory_cost integer)""")
         self.on_submit = []
         self.on_update = []
         self.on_delete = []
+        self.on_bulk_update = []
+        self.on_import = []
+        self.invalidate_cache()
             
     ROW_TUPLE = namedtuple("Row", ('name', 'email', 'password', 'website')) # todo: build from FIELDS, reuse same gen func with Form?
+    IMPORT_REPORT = namedtuple("ImportReport", ('submitted', 'updated', 'skipped'))
+    IMPORT_CONFLICT_POLICIES = ('skip', 'overwrite', 'rename')
+    IMPORT_BATCH_SIZE = 500
+    FETCH_BATCH_SIZE = 256
     
+    def _notify(self, event, *args):
+        for callback in getattr(self, event):
+            callback(*args)
+
     def cursor(self, existing_cursor=None, name=''):
-        return Cursor(self.path, name) if existing_cursor is None else existing_cursor
+        return Cursor(self._connections, name, on_rollback=self._drop_row_cache) if existing_cursor is None else existing_cursor
+
+    def close(self):
+        self._connections.close()
+
+    def _drop_row_cache(self):
+        # after a rollback the rows are reloaded on next use, a vault found over budget stays on plain SQL lookups
+        self._row_cache = None
+        self._row_cache_version = None
+        self._row_cache_checked_at = None
+
+    def invalidate_cache(self):
+        # for changes made behind the manager's back, which may also have brought the vault back under budget
+        self._drop_row_cache()
+        self._row_cache_enabled = self._row_cache_budget is not None
+
+    def _cached_rows(self):
+        if not self._row_cache_enabled:
+            return None
+        now = time.monotonic()
+        if self._row_cache is not None and now - self._row_cache_checked_at < self.ROW_CACHE_DISK_CHECK_INTERVAL:
+            return self._row_cache
+        self._row_cache_checked_at = now
+        with self.cursor() as cursor:
+            # data_version only changes when another connection (or process) committed to the file
+            version = (id(cursor.connection), cursor.fetch("PRAGMA data_version")[0][0])
+            if self._row_cache is None or version != self._row_cache_version:
+                self._row_cache = RowCache(self._row_cache_budget)
+                self._row_cache_version = version
+                for row in cursor.fetch("SELECT * FROM manager"):
+                    if not self._row_cache.put(DatabaseManager.ROW_TUPLE(*row)):
+                        self._row_cache = None
+                        self._row_cache_enabled = False # over budget, stay on plain SQL lookups
+                        break
+        return self._row_cache
+
+    def _cache_row(self, fields, insert=True):
+        rows = self._row_cache
+        if rows is not None and (insert or fields.name in rows):
+            row = DatabaseManager.ROW_TUPLE(fields.name, fields.email, fields.password, fields.website)
+            if not rows.put(row):
+                self._row_cache = None
+                self._row_cache_enabled = False
+
+    def _uncache_row(self, name):
+        if self._row_cache is not None:
+            self._row_cache.remove(name)
     
     def _get_master_pwd_hash(self):
         with self.cursor() as cursor:
             hash_in_list = cursor.fetch("SELECT * FROM master_pwd LIMIT 1")
         return hash_in_list[0][0] if hash_in_list else None
 
-    def set_master_pwd(self, password):
+    def get_kdf_params(self, cursor=None):
+        # vaults written before the parameters were stored used the defaults
+        with self.cursor(cursor) as cursor:
+            rows = cursor.fetch("SELECT algorithm, iterations, memory_cost FROM kdf_params LIMIT 1")
+        return kdf.KDF_PARAMS(*rows[0]) if rows else kdf.DEFAULT_KDF_PARAMS
+
+    def set_master_pwd(self, password, cursor=None, kdf_params=None):
         salt = os.urandom(SALT_LENGTH)
-        key = hash_password(password, salt)
-        stored_hash = salt + key
-        with self.cursor() as cursor:
+        with self.cursor(cursor) as cursor:
+            if kdf_params is None:
+                kdf_params = self.get_kdf_params(cursor)
+            verifier, vault_key = derive_master_keys(password, salt, kdf_params)
+            stored_hash = MASTER_KEY_MAGIC + salt + verifier
             if cursor.fetch("SELECT * FROM master_pwd LIMIT 1"):
                 cursor.execute("UPDATE master_pwd SET hashed_password = :hash", {'hash': stored_hash})
             else:
                 cursor.execute("INSERT INTO master_pwd VALUES (:hash)", {'hash': stored_hash})
+            cursor.execute("DELETE FROM kdf_params")
+            cursor.execute("INSERT INTO kdf_params VALUES (:algorithm, :iterations, :memory_cost)", kdf_params._asdict())
+        return vault_key
+
+    def unlock_master_pwd(self, password):
+        # the vault key derived along with the verifier, None for a wrong password or a legacy hash
+        stored_hash = self._get_master_pwd_hash()
+        if stored_hash is None or not stored_hash.startswith(MASTER_KEY_MAGIC):
+            return None
+        stored_hash = stored_hash[len(MASTER_KEY_MAGIC):]
+        salt, stored_verifier = stored_hash[:SALT_LENGTH], stored_hash[SALT_LENGTH:]
+        verifier, vault_key = derive_master_keys(password, salt, self.get_kdf_params())
+        return vault_key if hmac.compare_digest(verifier, stored_verifier) else None
+
+    def is_master_pwd_legacy(self):
+        stored_hash = self._get_master_pwd_hash()
+        return stored_hash is not None and not stored_hash.startswith(MASTER_KEY_MAGIC)
 
     def check_master_pwd(self, password):
         stored_hash = self._get_master_pwd_hash()
         if stored_hash is None:
             return False
+        if stored_hash.startswith(MASTER_KEY_MAGIC):
+            return self.unlock_master_pwd(password) is not None
         salt, key = stored_hash[:SALT_LENGTH], stored_hash[SALT_LENGTH:]
         return key == hash_password(password, salt)
     
     def has_master_pwd(self):
         return self._get_master_pwd_hash() is not None
 
-    def fetch_all(self):
-        with self.cursor() as cursor:
+    def get_keyring_entry(self, name, cursor=None):
+        with self.cursor(cursor) as cursor:
+            rows = cursor.fetch("SELECT value FROM keyring WHERE name = :name LIMIT 1", {'name': name})
+        return rows[0][0] if rows else None
+
+    def set_keyring_entry(self, name, value, cursor=None):
+        with self.cursor(cursor) as cursor:
+            cursor.execute("INSERT OR REPLACE INTO keyring VALUES (:name, :value)", {'name': name, 'value': value})
+
+    def fetch_all(self, cursor=None):
+        with self.cursor(cursor) as cursor:
             all_rows = cursor.fetch("SELECT * FROM manager")
         return map(lambda row: DatabaseManager.ROW_TUPLE(*row), all_rows)
     
+    def iter_rows(self, cursor=None, batch_size=FETCH_BATCH_SIZE):
+        with self.cursor(cursor, name="iter_rows") as cursor:
+            for row in cursor.fetch_many("SELECT * FROM manager", batch_size=batch_size):
+                yield DatabaseManager.ROW_TUPLE(*row)
+
+    @staticmethod
+    def _search_clause(search_tokens):
+        # same semantics as the table view search: every token is a case-sensitive substring of some field
+        clause = " AND ".join("(instr(name, ?) > 0 OR instr(email, ?) > 0 OR instr(website, ?) > 0)" for _ in search_tokens)
+        return (" WHERE " + clause if clause else ""), [token for token in search_tokens for _ in range(3)]
+
+    def count(self, search_tokens=()):
+        where, parameters = self._search_clause(search_tokens)
+        with self.cursor() as cursor:
+            return cursor.fetch("SELECT COUNT(*) FROM manager" + where, parameters)[0][0]
+
+    def fetch_page(self, offset, limit, search_tokens=()):
+        # newest rows first, the order in which the table view displays them
+        where, parameters = self._search_clause(search_tokens)
+        with self.cursor() as cursor:
+            rows = cursor.fetch("SELECT * FROM manager" + where + " ORDER BY rowid DESC LIMIT ? OFFSET ?", parameters + [limit, offset])
+        return [DatabaseManager.ROW_TUPLE(*row) for row in rows]
+
     def fetch_one(self, name):
+        cached_rows = self._cached_rows()
+        if cached_rows is not None:
+            return cached_rows.get(name)
         with self.cursor() as cursor:
             rows = cursor.fetch("SELECT * FROM manager WHERE name = :name LIMIT 1", {'name': name})
         return DatabaseManager.ROW_TUPLE(*rows[0]) if rows else None
     
     def exists(self, name):
+        cached_rows = self._cached_rows()
+        if cached_rows is not None:
+            return name in cached_rows
         with self.cursor() as cursor:
             return bool(cursor.fetch("SELECT name FROM manager WHERE name = :name", {'name': name}))
 
@@ -142,8 +400,8 @@ class DatabaseManager:
                     'website': fields.website,
                 }
             )
-        for callback in self.on_submit:
-            callback(fields)
+            self._cache_row(fields)
+        self._notify('on_submit', fields)
         return True
 
 
@@ -152,8 +410,8 @@ class DatabaseManager:
             return Error("Please fill in a name!")
         with self.cursor(cursor) as cursor:
             cursor.execute("DELETE FROM manager WHERE manager.name = :name", { 'name': name })
-        for callback in self.on_delete:
-            callback(name)
+            self._uncache_row(name)
+        self._notify('on_delete', name)
         return True
 
 
@@ -169,12 +427,87 @@ class DatabaseManager:
                                'website': fields.website,
                             }
                         ) #sanitize
-        for callback in self.on_update:
-            callback(fields)
+            self._cache_row(fields, insert=False)
+        self._notify('on_update', fields)
         return True
 
-    def recipher(self, decrypt, encrypt):
-        with self.cursor(name="recipher") as cursor:
-            for row in self.fetch_all():
-                new_row = row._replace(password=encrypt(decrypt(row.password)))
-                self.update(new_row, cursor=cursor)
+    def recipher(self, decrypt, encrypt, predicate=None, cursor=None, workers=None, progress=None):
+        def _recipher_row(row):
+            password = decrypt(row.password)
+            if password is None:
+                return None # undecryptable either way, leave the row untouched
+            return row._replace(password=encrypt(password))
+
+        with self.cursor(cursor, name="recipher") as cursor:
+            rows = [row for row in self.fetch_all(cursor=cursor) if predicate is None or predicate(row.password)]
+            new_rows = []
+            # the KDF and cipher primitives release the GIL, so threads are enough to spread the work over cores
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recipher") as pool:
+                for done, new_row in enumerate(pool.map(_recipher_row, rows), start=1):
+                    if new_row is not None:
+                        new_rows.append(new_row)
+                    if progress is not None:
+                        progress(done, len(rows))
+            cursor.executemany("UPDATE manager SET password = :password WHERE name = :name",
+                               [row._asdict() for row in new_rows])
+            for row in new_rows:
+                self._cache_row(row, insert=False)
+        if new_rows:
+            self._notify('on_bulk_update', new_rows)
+        return len(new_rows)
+
+    def _existing_names(self, names, cursor):
+        placeholders = ', '.join('?' * len(names))
+        return set(row[0] for row in cursor.fetch(f"SELECT name FROM manager WHERE name IN ({placeholders})", names))
+
+    def _free_name(self, name, taken, cursor):
+        for suffix in itertools.count(2):
+            candidate = f"{name} ({suffix})"
+            if candidate not in taken and not self._existing_names([candidate], cursor):
+                return candidate
+
+    def import_many(self, rows, encrypt=None, on_conflict='skip', batch_size=IMPORT_BATCH_SIZE, workers=None, cursor=None, progress=None):
+        if on_conflict not in self.IMPORT_CONFLICT_POLICIES:
+            raise ValueError(f"Unknown conflict policy '{on_conflict}', expected one of {self.IMPORT_CONFLICT_POLICIES}")
+
+        def _prepare_row(row):
+            return row if encrypt is None else row._replace(password=encrypt(row.password))
+
+        report = DatabaseManager.IMPORT_REPORT([], [], [])
+        rows, taken, done = iter(rows), set(), 0
+        with self.cursor(cursor, name="import_many") as cursor, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import") as pool:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                taken.update(self._existing_names([fields.name for fields in batch if fields.name], cursor))
+                to_insert, to_update = [], []
+                for fields in batch:
+                    row = DatabaseManager.ROW_TUPLE(fields.name, fields.email or '', fields.password or '', fields.website or '')
+                    if not row.name or (row.name in taken and on_conflict == 'skip'):
+                        report.skipped.append(row.name)
+                        continue
+                    if row.name in taken and on_conflict == 'overwrite':
+                        to_update.append(row)
+                        continue
+                    if row.name in taken:
+                        row = row._replace(name=self._free_name(row.name, taken, cursor))
+                    taken.add(row.name)
+                    to_insert.append(row)
+                to_insert, to_update = (list(pool.map(_prepare_row, batch_rows)) for batch_rows in (to_insert, to_update))
+                cursor.executemany("INSERT INTO manager VALUES (:name, :email, :password, :website)", [row._asdict() for row in to_insert])
+                cursor.executemany("UPDATE manager SET email = :email, password = :password, website = :website WHERE name = :name",
+                                   [row._asdict() for row in to_update])
+                for row in to_insert:
+                    self._cache_row(row)
+                for row in to_update:
+                    self._cache_row(row, insert=False)
+                report.submitted.extend(to_insert)
+                report.updated.extend(to_update)
+                done += len(batch)
+                if progress is not None:
+                    progress(done, None)
+        if report.submitted or report.updated:
+            self._notify('on_import', report)
+        return report
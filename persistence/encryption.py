@@ -3,9 +3,13 @@ import base64
 import cryptography.hazmat.primitives.kdf.pbkdf2 as key_derivation
 import cryptography.hazmat.backends
 from cryptography.hazmat.primitives import hashes
+from collections import OrderedDict
 from funcy import compose
 
 import os
+import threading
+
+from persistence import kdf
 
 
 class DummyCipher:
@@ -25,25 +29,66 @@ class DummyCipher:
         return data_bytes
 
 
+class KeyCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, salt):
+        with self._lock:
+            key = self._keys.get(salt)
+            if key is not None:
+                self._keys.move_to_end(salt)
+            return key
+
+    def put(self, salt, key):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._keys[salt] = key
+            self._keys.move_to_end(salt)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
 class FernetPasswordCipher:
     SALT_LENGTH = 32
-    KDF_ITERATIONS = 100000
+    KDF_ITERATIONS = kdf.DEFAULT_KDF_PARAMS.iterations # fixed, records sealed with their own salt never stored it
+    KEY_CACHE_SIZE = 256
 
-    def __init__(self, password):
+    def __init__(self, password, key_cache_size=None):
         if isinstance(password, str):
             password = password.encode()
-        self._password = bytearray(password)
+        self._password = None if password is None else bytearray(password)
+        self._key_cache = KeyCache(self.KEY_CACHE_SIZE if key_cache_size is None else key_cache_size)
 
     def has_password(self):
         return self._password is not None
 
     def clear_password(self):
-        self._password[:] = b'\0' * len(self._password)
+        self._key_cache.clear()
+        if self._password is not None:
+            self._password[:] = b'\0' * len(self._password)
         self._password = None
 
     def _derive_key(self, salt):
         if not self.has_password():
             raise ValueError("FernetPasswordCipher: No password currently set, cannot derive key")
+        key = self._key_cache.get(salt)
+        if key is None:
+            key = self._run_kdf(salt)
+            self._key_cache.put(salt, key)
+        return key
+
+    def _run_kdf(self, salt):
         key_derivator = key_derivation.PBKDF2HMAC(
             algorithm=hashes.SHA256(), length=32, salt=salt, iterations=self.KDF_ITERATIONS,
             backend=cryptography.hazmat.backends.default_backend()
@@ -68,8 +113,86 @@ class FernetPasswordCipher:
             return None
 
 
+class FernetVaultCipher(FernetPasswordCipher):
+    RECORD_MAGIC = b'PMv2'
+
+    def __init__(self, password, vault_salt, wrapped_key=None, data_key=None, key_cache_size=None, key_encryption_key=None):
+        super().__init__(password, key_cache_size)
+        self._vault_salt = vault_salt
+        if key_encryption_key is None:
+            key_encryption_key = self._run_kdf(vault_salt) # data keys wrapped before the single-KDF unlock
+        self._key_encryption_key = key_encryption_key
+        self._key_wrapper = cryptography.fernet.Fernet(key_encryption_key)
+        if data_key is None:
+            # vaults sealed before envelope encryption used the password-derived key for the records themselves
+            data_key = key_encryption_key if wrapped_key is None else self._key_wrapper.decrypt(wrapped_key)
+        self._data_key = data_key
+        self._vault = cryptography.fernet.Fernet(data_key)
+
+    @classmethod
+    def new_vault_salt(cls):
+        return os.urandom(cls.SALT_LENGTH)
+
+    @staticmethod
+    def new_data_key():
+        return cryptography.fernet.Fernet.generate_key()
+
+    @classmethod
+    def is_legacy_record(cls, encrypted_data):
+        return not encrypted_data.startswith(cls.RECORD_MAGIC)
+
+    @property
+    def vault_salt(self):
+        return self._vault_salt
+
+    @property
+    def wrapped_key(self):
+        return self._key_wrapper.encrypt(self._data_key)
+
+    def rewrapped(self, password, vault_salt, key_encryption_key=None):
+        return type(self)(password, vault_salt, data_key=self._data_key, key_cache_size=self._key_cache.max_size,
+                          key_encryption_key=key_encryption_key)
+
+    def with_data_key(self, data_key):
+        password = None if self._password is None else bytes(self._password)
+        return type(self)(password, self._vault_salt, data_key=data_key, key_cache_size=self._key_cache.max_size,
+                          key_encryption_key=self._key_encryption_key)
+
+    def has_password(self):
+        return self._vault is not None
+
+    def forget_password(self):
+        # only legacy records need the password itself, once they are upgraded the keys are enough
+        super().clear_password()
+
+    def clear_password(self):
+        super().clear_password()
+        self._key_wrapper = self._key_encryption_key = self._data_key = self._vault = None
+
+    def encrypt(self, data_bytes):
+        return self.RECORD_MAGIC + self._vault.encrypt(data_bytes)
+
+    def decrypt(self, encrypted_data):
+        if not self.is_legacy_record(encrypted_data):
+            try:
+                return self._vault.decrypt(encrypted_data[len(self.RECORD_MAGIC):])
+            except cryptography.fernet.InvalidToken:
+                pass # may still be a legacy record whose salt happens to start with the magic
+            except (TypeError, AttributeError):
+                return None
+        if self._password is None:
+            return None
+        return super().decrypt(encrypted_data)
+
+
 class Encryption:
-    def __init__(self, db, cipher_type=FernetPasswordCipher):
+    VAULT_SALT_ENTRY = 'vault_salt'
+    WRAPPED_KEY_ENTRY = 'wrapped_key'
+    RECORDS_UPGRADED_ENTRY = 'records_upgraded' # set once no record is left to upgrade, or none can be
+    KDF_ALGORITHM = kdf.PBKDF2
+    KDF_TARGET_SECONDS = kdf.CALIBRATION_TARGET
+
+    def __init__(self, db, cipher_type=FernetVaultCipher):
         self._db = db
         self._cipher = DummyCipher()
         self._cipher_type = cipher_type
@@ -82,18 +205,93 @@ class Encryption:
     def password(self, pwd):
         if self.password or not self._db.has_master_pwd():
             self.update_password(pwd)
+        elif not self.unlock(pwd):
+            raise ValueError("Invalid master password")
+
+    @staticmethod
+    def _fernet_key(vault_key):
+        return base64.urlsafe_b64encode(vault_key)
+
+    def unlock(self, pwd, migrate=True):
+        # a single KDF run both checks the password and yields the key the data key is wrapped with,
+        # without migrate nothing is written, for read-only use of the vault
+        if self._db.is_master_pwd_legacy():
+            if not self._db.check_master_pwd(pwd):
+                return False
+            self.load_password(pwd, migrate=migrate)
+            if migrate:
+                # stores a single-KDF verifier and re-wraps the data key with its vault key, with the parameters the
+                # legacy hash already used: calibrating here would give back the time the single KDF run saved
+                self.update_password(pwd, kdf_params=kdf.DEFAULT_KDF_PARAMS)
+            return True
+        vault_key = self._db.unlock_master_pwd(pwd)
+        if vault_key is None:
+            return False
+        self.load_password(pwd, vault_key, migrate=migrate)
+        return True
+
+    def load_password(self, pwd, vault_key=None, migrate=True):
+        vault_salt = self._db.get_keyring_entry(self.VAULT_SALT_ENTRY)
+        wrapped_key = self._db.get_keyring_entry(self.WRAPPED_KEY_ENTRY)
+        key_encryption_key = None if vault_key is None else self._fernet_key(vault_key)
+        if vault_salt is None:
+            cipher = self._cipher_type(pwd, self._cipher_type.new_vault_salt(), data_key=self._cipher_type.new_data_key(),
+                                       key_encryption_key=key_encryption_key)
         else:
-            self.load_password(pwd)
+            cipher = self._cipher_type(pwd, vault_salt, wrapped_key=wrapped_key, key_encryption_key=key_encryption_key)
+        if wrapped_key is None and migrate:
+            self._store_keyring(cipher)
+        self._set_cipher(cipher)
+        if migrate:
+            if self._db.get_keyring_entry(self.RECORDS_UPGRADED_ENTRY) is None:
+                self.upgrade_records()
+            if vault_key is not None:
+                cipher.forget_password()
 
-    def load_password(self, pwd):
-        self._set_cipher(self._cipher_type(pwd))
+    def update_password(self, pwd, kdf_params=None):
+        # without explicit parameters, a new password gets a verifier calibrated for this host,
+        # so unlocking takes about the same time everywhere
+        if kdf_params is None:
+            kdf_params = kdf.calibrate(self.KDF_TARGET_SECONDS, self.KDF_ALGORITHM)
+        vault_salt = self._cipher_type.new_vault_salt()
+        if self.password:
+            # only the data key is re-wrapped, records stay as they are
+            with self._db.cursor(name="update_password") as cursor:
+                vault_key = self._db.set_master_pwd(pwd, cursor=cursor, kdf_params=kdf_params)
+                new_cipher = self._cipher.rewrapped(pwd, vault_salt, key_encryption_key=self._fernet_key(vault_key))
+                self._store_keyring(new_cipher, cursor=cursor)
+        else:
+            old_cipher = self._cipher
+            with self._db.cursor(name="update_password") as cursor:
+                vault_key = self._db.set_master_pwd(pwd, cursor=cursor, kdf_params=kdf_params)
+                new_cipher = self._cipher_type(pwd, vault_salt, data_key=self._cipher_type.new_data_key(),
+                                               key_encryption_key=self._fernet_key(vault_key))
+                self._db.recipher(decrypt=old_cipher.decrypt, encrypt=new_cipher.encrypt, cursor=cursor)
+                self._store_keyring(new_cipher, cursor=cursor)
+                self._db.set_keyring_entry(self.RECORDS_UPGRADED_ENTRY, b'1', cursor=cursor)
+        new_cipher.forget_password()
+        self._set_cipher(new_cipher)
 
-    def update_password(self, pwd):
-        old_cipher, new_cipher = self._cipher, self._cipher_type(pwd)
-        self._db.recipher(decrypt=old_cipher.decrypt, encrypt=new_cipher.encrypt)
-        self._db.set_master_pwd(pwd)
+    def rotate_data_key(self, progress=None):
+        old_cipher = self._cipher
+        new_cipher = old_cipher.with_data_key(self._cipher_type.new_data_key())
+        with self._db.cursor(name="rotate_data_key") as cursor:
+            self._db.recipher(decrypt=old_cipher.decrypt, encrypt=new_cipher.encrypt, cursor=cursor, progress=progress)
+            self._store_keyring(new_cipher, cursor=cursor)
         self._set_cipher(new_cipher)
 
+    def _store_keyring(self, cipher, cursor=None):
+        with self._db.cursor(cursor) as cursor:
+            self._db.set_keyring_entry(self.VAULT_SALT_ENTRY, cipher.vault_salt, cursor=cursor)
+            self._db.set_keyring_entry(self.WRAPPED_KEY_ENTRY, cipher.wrapped_key, cursor=cursor)
+
+    def upgrade_records(self, progress=None):
+        upgraded = self._db.recipher(decrypt=self._cipher.decrypt, encrypt=self._cipher.encrypt,
+                                     predicate=self._cipher_type.is_legacy_record, progress=progress)
+        # records still left behind can't be decrypted with the master password, unlocking doesn't try them again
+        self._db.set_keyring_entry(self.RECORDS_UPGRADED_ENTRY, b'1')
+        return upgraded
+
     def _set_cipher(self, cipher):
         self._cipher.clear_password()
         self._cipher = cipher
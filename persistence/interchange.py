@@ -0,0 +1,76 @@
+import csv
+import json
+import os
+
+from persistence.database import DatabaseManager
+
+FIELD_NAMES = DatabaseManager.ROW_TUPLE._fields
+FIELD_ALIASES = {
+    'title': 'name',
+    'username': 'email', 'login': 'email', 'login_username': 'email',
+    'login_password': 'password',
+    'url': 'website', 'login_uri': 'website',
+}
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def record_to_row(record):
+    if not isinstance(record, dict):
+        raise ValueError(f"Expected one object per entry, got {type(record).__name__}")
+    fields = dict.fromkeys(FIELD_NAMES, '')
+    for key, value in record.items():
+        key = str(key).strip().lower()
+        key = FIELD_ALIASES.get(key, key)
+        if key in fields and value is not None:
+            fields[key] = str(value)
+    return DatabaseManager.ROW_TUPLE(**fields)
+
+
+def read_csv(file):
+    for record in csv.DictReader(file):
+        yield record_to_row(record)
+
+
+def _iter_json_values(file, chunk_size=JSON_CHUNK_SIZE):
+    # accepts either a top-level array of objects or one object per line, without loading the whole file
+    decoder = json.JSONDecoder()
+    buffer, eof, in_array = '', False, None
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer and in_array is None:
+            in_array = buffer.startswith('[')
+            buffer = buffer[1:] if in_array else buffer
+            continue
+        if buffer and in_array and buffer.startswith(']'):
+            return
+        if buffer:
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                buffer = buffer[end:]
+                yield value
+                continue
+        if eof:
+            return
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def read_json(file, chunk_size=JSON_CHUNK_SIZE):
+    for record in _iter_json_values(file, chunk_size):
+        yield record_to_row(record)
+
+
+READERS = {'.csv': read_csv, '.json': read_json, '.jsonl': read_json}
+
+
+def import_file(db, encryption, path, **kwargs):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported import format '{extension}', expected one of {tuple(READERS)}")
+    with open(path, newline='', encoding='utf-8') as file:
+        return db.import_many(READERS[extension](file), encrypt=encryption.encrypt, **kwargs)
@@ -0,0 +1,77 @@
+import functools
+import hashlib
+import os
+import time
+
+from collections import namedtuple
+
+KDF_PARAMS = namedtuple('KdfParams', ('algorithm', 'iterations', 'memory_cost'))
+PBKDF2 = 'pbkdf2-sha256'
+SCRYPT = 'scrypt' # memory_cost is scrypt's N and iterations its parallelization p, the block size r stays 8
+ALGORITHMS = (PBKDF2, SCRYPT)
+SCRYPT_BLOCK_SIZE = 8
+# what every vault used before parameters were stored, calibration never goes below it
+DEFAULT_KDF_PARAMS = KDF_PARAMS(PBKDF2, 100000, 0)
+MIN_SCRYPT_COST = 2 ** 15
+MAX_SCRYPT_MEMORY = 256 * 1024 * 1024 # in bytes
+MAX_PBKDF2_ITERATIONS = 10 ** 7 # about 100 times what calibration picks, parameters read from untrusted data stay below
+CALIBRATION_TARGET = 0.1 # in seconds
+
+
+def _scrypt_memory(params):
+    return 128 * SCRYPT_BLOCK_SIZE * params.memory_cost * params.iterations
+
+
+def check_params(params, max_memory=MAX_SCRYPT_MEMORY):
+    # for parameters that were not produced here, a huge cost would make derive run for hours
+    if params.algorithm == PBKDF2:
+        if not 1 <= params.iterations <= MAX_PBKDF2_ITERATIONS:
+            raise ValueError(f"PBKDF2 iterations must be between 1 and {MAX_PBKDF2_ITERATIONS}, got {params.iterations}")
+    elif params.algorithm == SCRYPT:
+        cost = params.memory_cost
+        if params.iterations < 1 or cost < 2 or cost & (cost - 1):
+            raise ValueError(f"Invalid scrypt parameters N={cost}, p={params.iterations}")
+        if _scrypt_memory(params) > max_memory:
+            raise ValueError(f"scrypt parameters need {_scrypt_memory(params)} bytes, more than {max_memory}")
+    else:
+        raise ValueError(f"Unknown KDF algorithm '{params.algorithm}', expected one of {ALGORITHMS}")
+
+
+def derive(password, salt, params=DEFAULT_KDF_PARAMS, length=32):
+    if isinstance(password, str):
+        password = password.encode('utf-8')
+    if params.algorithm == PBKDF2:
+        return hashlib.pbkdf2_hmac('sha256', password, salt, params.iterations, dklen=length)
+    if params.algorithm == SCRYPT:
+        return hashlib.scrypt(password, salt=salt, n=params.memory_cost, r=SCRYPT_BLOCK_SIZE, p=params.iterations,
+                              maxmem=_scrypt_memory(params) + 1024 * 1024, dklen=length)
+    raise ValueError(f"Unknown KDF algorithm '{params.algorithm}', expected one of {ALGORITHMS}")
+
+
+def _time_derive(params):
+    salt = os.urandom(16)
+    start = time.perf_counter()
+    derive(b'calibration', salt, params)
+    return time.perf_counter() - start
+
+
+@functools.lru_cache(maxsize=None)
+def calibrate(target_seconds=CALIBRATION_TARGET, algorithm=PBKDF2, max_memory=MAX_SCRYPT_MEMORY):
+    # the cost scales linearly with the parameter, so a long enough probe run is enough to extrapolate
+    if algorithm == PBKDF2:
+        probe = KDF_PARAMS(PBKDF2, 10000, 0)
+        elapsed = _time_derive(probe)
+        while elapsed < target_seconds / 4: # probes too short are dominated by noise
+            probe = probe._replace(iterations=probe.iterations * 2)
+            elapsed = _time_derive(probe)
+        iterations = int(probe.iterations * target_seconds / elapsed)
+        return KDF_PARAMS(PBKDF2, max(DEFAULT_KDF_PARAMS.iterations, iterations // 1000 * 1000), 0)
+    if algorithm == SCRYPT:
+        params = KDF_PARAMS(SCRYPT, 1, MIN_SCRYPT_COST)
+        elapsed = _time_derive(params)
+        # N has to stay a power of two, so keep doubling while the next step is still closer to the target
+        while elapsed * 1.5 < target_seconds and _scrypt_memory(params._replace(memory_cost=params.memory_cost * 2)) <= max_memory:
+            params = params._replace(memory_cost=params.memory_cost * 2)
+            elapsed *= 2
+        return params
+    raise ValueError(f"Unknown KDF algorithm '{algorithm}', expected one of {ALGORITHMS}")
@@ -0,0 +1,65 @@
+import hmac
+import itertools
+import os
+
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from security import strength
+from security.strength import compute_password_strength, PWD_STRENGTH
+
+AUDIT_ENTRY = namedtuple('AuditEntry', ('name', 'strength', 'in_dictionary', 'reused_with'))
+AUDIT_REPORT = namedtuple('AuditReport', ('entries', 'weak', 'reused', 'in_dictionary', 'undecryptable'))
+WEAK_STRENGTH = PWD_STRENGTH.WEAK.value
+
+
+def dictionary_matches(passwords, word_set):
+    # one batched walk over the word set instead of an independent binary search per password
+    passwords = list(set(passwords))
+    if not passwords or not word_set:
+        return set()
+    return set(itertools.compress(passwords, word_set.contains_many(passwords)))
+
+
+def _decrypt_rows(rows, encryption, workers=None, progress=None):
+    def _decrypt_row(row):
+        failed = []
+        password = encryption.decrypt(row.password, report_error_func=failed.append)
+        return row.name, None if failed else password
+
+    # the cipher primitives release the GIL, so threads are enough to spread the work over cores
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audit") as pool:
+        for done, result in enumerate(pool.map(_decrypt_row, rows), start=1):
+            if progress is not None:
+                progress(done, len(rows))
+            yield result
+
+
+def audit_vault(db, encryption, word_set=None, workers=None, progress=None):
+    if word_set is None:
+        word_set = strength.common_passwords()
+    key = os.urandom(32) # groups passwords without keeping them as dictionary keys
+    groups, passwords, undecryptable = defaultdict(list), {}, []
+    for name, password in _decrypt_rows(list(db.fetch_all()), encryption, workers, progress):
+        if password is None:
+            undecryptable.append(name)
+            continue
+        digest = hmac.digest(key, password.encode('utf-8'), 'sha256')
+        groups[digest].append(name)
+        passwords.setdefault(digest, password)
+
+    in_dictionary = dictionary_matches(passwords.values(), word_set)
+    entries, weak, reused, dictionary_names = [], [], [], []
+    for digest, names in groups.items():
+        password = passwords.pop(digest)
+        found = password in in_dictionary
+        score = PWD_STRENGTH.VERY_WEAK.value if found else compute_password_strength(password, check_dictionary=False)
+        if len(names) > 1:
+            reused.append(tuple(names))
+        for name in names:
+            entries.append(AUDIT_ENTRY(name, score, found, tuple(other for other in names if other != name)))
+            if score <= WEAK_STRENGTH:
+                weak.append(name)
+            if found:
+                dictionary_names.append(name)
+    return AUDIT_REPORT(entries, weak, reused, dictionary_names, undecryptable)
@@ -0,0 +1,59 @@
+import hashlib
+import math
+import mmap
+
+
+class BloomFilter:
+    MAGIC = b'BLOOM1'
+
+    def __init__(self, bit_count, hash_count, bits=None, offset=0, tag=b'-'):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.tag = tag  # identifies the data the filter was built for, so stale sidecars can be ignored
+        self._bits = bytearray((bit_count + 7) // 8) if bits is None else bits
+        self._offset = offset
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=0.01, tag=b'-'):
+        capacity = max(capacity, 1)
+        bit_count = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        hash_count = max(1, round(bit_count / capacity * math.log(2)))
+        return cls(bit_count, hash_count, tag=tag)
+
+    @staticmethod
+    def _hashes(item):
+        # double hashing: the k probe positions are h1 + i * h2
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, item):
+        h1, h2 = self._hashes(item)
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % self.bit_count
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        h1, h2 = self._hashes(item)
+        bits, offset, bit_count = self._bits, self._offset, self.bit_count
+        for i in range(self.hash_count):
+            position = (h1 + i * h2) % bit_count
+            if not bits[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(b"%s %d %d %s\n" % (self.MAGIC, self.bit_count, self.hash_count, self.tag))
+            f.write(self._bits)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic, bit_count, hash_count, tag = f.readline().split()
+            if magic != cls.MAGIC:
+                raise ValueError(f"{path} is not a bloom filter")
+            offset = f.tell()
+            bits = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(bits) - offset < (int(bit_count) + 7) // 8:
+            raise ValueError(f"{path} is truncated")
+        return cls(int(bit_count), int(hash_count), bits, offset, tag)
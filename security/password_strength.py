@@ -1,44 +1,89 @@
+import hmac
+import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk
-from collections import namedtuple
-from security.word_set import WordSet
-from security.time_cracker import number_results, TIME_IN_NS
-
-COMMON_PASSWORDS_LENGTH_9_TO_16 = WordSet('rockyou_9-16.ws')
-
-def compute_password_strength(pwd):
-    if not pwd:
-        return 0
-    if pwd in COMMON_PASSWORDS_LENGTH_9_TO_16:
-        return PWD_STRENGTH.VERY_WEAK.value
-    number_combinations = number_results(pwd)
-    if number_combinations < TIME_IN_NS.HOUR:
-        return PWD_STRENGTH.VERY_WEAK.value
-    elif number_combinations < TIME_IN_NS.DAY:
-        return PWD_STRENGTH.WEAK.value
-    elif number_combinations < TIME_IN_NS.YEAR:
-        return PWD_STRENGTH.OK.value
-    elif number_combinations < 10 * TIME_IN_NS.YEAR:
-        return PWD_STRENGTH.GOOD.value
-    elif number_combinations < 500 * TIME_IN_NS.YEAR:
-        return PWD_STRENGTH.STRONG.value
-    else:
-        return PWD_STRENGTH.VERY_STRONG.value
-
-class DotDict(dict):
-    __getattr__ = dict.get
-    __setattr__ = dict.__setitem__
-    __delattr__ = dict.__delitem__
-
-
-PWD_STR_TUPLE = namedtuple('Strength', ('value', 'color', 'weight'))
-_PWD_STRENGTH = [ ('VERY_WEAK', 'orange red', .8), ('WEAK', 'dark orange', .8), ('OK', 'orange', .8), ('GOOD', 'gold', .8), ('STRONG', 'yellow green', .8), ('VERY_STRONG', 'sea green', .8) ]
-PWD_STRENGTH = DotDict({ strength: PWD_STR_TUPLE(value+1, color, weight) for (value, (strength, color, weight)) in enumerate(_PWD_STRENGTH) })
-
-def pwd_strength_to_string(pwd_strength):
-    if isinstance(pwd_strength, int):
-        pwd_strength = _PWD_STRENGTH[pwd_strength][0]
-    return pwd_strength[0] + pwd_strength.replace('_', ' ').lower()[1:]
+from collections import namedtuple, OrderedDict
+from functools import partial
+from security.strength import compute_password_strength, PWD_STRENGTH, _PWD_STRENGTH, pwd_strength_to_string
+
+class StrengthEvaluator:
+    CACHE_SIZE = 256
+
+    def __init__(self, evaluate=compute_password_strength, cache_size=CACHE_SIZE,
+                 fallback=partial(compute_password_strength, check_dictionary=False)):
+        self.evaluate = evaluate
+        self.fallback = fallback # when evaluate fails, e.g. the dictionary can't be read, so requesters still get a value
+        self.cache_size = cache_size
+        self._key = os.urandom(32) # cache keys are only meaningful inside this process, passwords are never stored
+        self._cache = OrderedDict()
+        self._pending = {} # requester -> latest (cache key, password, callback), older requests are dropped
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def _cache_key(self, password):
+        return hmac.digest(self._key, password.encode('utf-8'), 'sha256')
+
+    def cached(self, password):
+        key = self._cache_key(password)
+        with self._condition:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            return self._cache.get(key)
+
+    def request(self, requester, password, callback):
+        # callback runs on the worker thread, it must not touch Tk and only hands the value over to the requester's thread
+        key = self._cache_key(password)
+        with self._condition:
+            self._pending[requester] = (key, password, callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="password-strength", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self, requester):
+        with self._condition:
+            self._pending.pop(requester, None)
+
+    def _evaluate(self, key, password):
+        try:
+            value = self.evaluate(password)
+        except Exception as e:
+            # not cached, the next request tries again
+            print(f"Password strength evaluation failed: {e}")
+            try:
+                return self.fallback(password)
+            except Exception as e:
+                print(f"Password strength fallback failed: {e}")
+                return 0
+        with self._condition:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                requester = next(iter(self._pending))
+                key, password, callback = request = self._pending.pop(requester)
+                value = self._cache.get(key)
+            if value is None:
+                value = self._evaluate(key, password)
+            with self._condition:
+                if requester in self._pending:
+                    continue # superseded while it was being evaluated
+            try:
+                callback(value)
+            except Exception as e:
+                print(f"Password strength callback failed: {e}")
+
+
+EVALUATOR = StrengthEvaluator()
 
 class PasswordStrength(ttk.Frame):
     class Bar(tk.Canvas):
@@ -78,12 +123,49 @@ class PasswordStrength(ttk.Frame):
             text = '' if not val else _PWD_STRENGTH[val-1][0].replace('_', ' ').lower()
             self.itemconfig(self.text_id, text=text)
 
-    def __init__(self, parent, password_var):
+    POLL_INTERVAL = 50 # ms between checks for the worker's result, Tk is never called from the worker thread
+
+    def __init__(self, parent, password_var, evaluator=EVALUATOR):
         super().__init__(parent)
         self.var = tk.IntVar()
+        self.evaluator = evaluator
+        self._generation = 0
+        self._waiting_for = None # generation whose value the worker still owes
+        self._results = queue.Queue()
+        self._poll_id = None
         self.bar = PasswordStrength.Bar(self, singlemode=True)
         self.bar.pack(expand=True, fill=tk.BOTH)
         password_var.trace('w', lambda *args: self.update_bar(password_var.get()))
+        self.bind("<Destroy>", lambda event: self._on_destroy() if event.widget is self else None)
 
     def update_bar(self, password):
-        self.bar.set_value(compute_password_strength(password))
\ No newline at end of file
+        self._generation += 1
+        value = self.evaluator.cached(password) if password else 0
+        if value is not None:
+            self.bar.set_value(value)
+            self.evaluator.cancel(self)
+            self._waiting_for = None
+            return
+        generation = self._waiting_for = self._generation
+        self.evaluator.request(self, password, lambda value: self._results.put((generation, value)))
+        if self._poll_id is None:
+            self._poll_id = self.after(self.POLL_INTERVAL, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        while True:
+            try:
+                generation, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self._waiting_for:
+                self.bar.set_value(value)
+                self._waiting_for = None
+        if self._waiting_for is not None:
+            self._poll_id = self.after(self.POLL_INTERVAL, self._poll)
+
+    def _on_destroy(self):
+        self.evaluator.cancel(self)
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
\ No newline at end of file
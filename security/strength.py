@@ -0,0 +1,54 @@
+import threading
+from collections import namedtuple
+from security.word_set import open_word_set
+from security.time_cracker import number_results, TIME_IN_NS
+
+COMMON_PASSWORDS_PATH = 'rockyou_9-16.ws'
+_common_passwords = None
+_common_passwords_lock = threading.Lock()
+
+def common_passwords():
+    # opened on first use, importing this module must stay cheap for the startup path
+    global _common_passwords
+    if _common_passwords is None:
+        with _common_passwords_lock:
+            if _common_passwords is None:
+                _common_passwords = open_word_set(COMMON_PASSWORDS_PATH)
+    return _common_passwords
+
+def warm_up_common_passwords():
+    threading.Thread(target=common_passwords, name="common-passwords", daemon=True).start()
+
+def compute_password_strength(pwd, check_dictionary=True):
+    if not pwd:
+        return 0
+    if check_dictionary and pwd in common_passwords():
+        return PWD_STRENGTH.VERY_WEAK.value
+    number_combinations = number_results(pwd)
+    if number_combinations < TIME_IN_NS.HOUR:
+        return PWD_STRENGTH.VERY_WEAK.value
+    elif number_combinations < TIME_IN_NS.DAY:
+        return PWD_STRENGTH.WEAK.value
+    elif number_combinations < TIME_IN_NS.YEAR:
+        return PWD_STRENGTH.OK.value
+    elif number_combinations < 10 * TIME_IN_NS.YEAR:
+        return PWD_STRENGTH.GOOD.value
+    elif number_combinations < 500 * TIME_IN_NS.YEAR:
+        return PWD_STRENGTH.STRONG.value
+    else:
+        return PWD_STRENGTH.VERY_STRONG.value
+
+class DotDict(dict):
+    __getattr__ = dict.get
+    __setattr__ = dict.__setitem__
+    __delattr__ = dict.__delitem__
+
+
+PWD_STR_TUPLE = namedtuple('Strength', ('value', 'color', 'weight'))
+_PWD_STRENGTH = [ ('VERY_WEAK', 'orange red', .8), ('WEAK', 'dark orange', .8), ('OK', 'orange', .8), ('GOOD', 'gold', .8), ('STRONG', 'yellow green', .8), ('VERY_STRONG', 'sea green', .8) ]
+PWD_STRENGTH = DotDict({ strength: PWD_STR_TUPLE(value+1, color, weight) for (value, (strength, color, weight)) in enumerate(_PWD_STRENGTH) })
+
+def pwd_strength_to_string(pwd_strength):
+    if isinstance(pwd_strength, int):
+        pwd_strength = _PWD_STRENGTH[pwd_strength][0]
+    return pwd_strength[0] + pwd_strength.replace('_', ' ').lower()[1:]
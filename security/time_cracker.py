@@ -1,5 +1,4 @@
 import csv
-import math
 import string
 
 from itertools import combinations
@@ -26,27 +25,35 @@ def gen_pwds(start_length, stop_length=None):
                 pwds.update(pwd)
     return pwds
 
-def multicomb(n, k):
-    return math.comb(n+k-1, k)
+# bit of each charset, a password's alphabet size only depends on which charsets it touches
+_CHARSET_BITS = {c: 1 << bit for bit, charset in enumerate(CHARSETS) for c in charset}
+_ALPHABET_SIZES = [sum(len(charset) for bit, charset in enumerate(CHARSETS) if mask >> bit & 1)
+                   for mask in range(1 << len(CHARSETS))]
+# cumulative sums of multicomb(a, L) * L!, i.e. of the rising factorials a * (a+1) * ... * (a+L-1), per alphabet size a
+_CUMULATIVE_RESULTS = {}
 
-def number_results(target):
-    charsets = []
-    if any(map(lambda c: c in string.ascii_lowercase, target)):
-        charsets.append(string.ascii_lowercase)
-    if any(map(lambda c: c in string.ascii_uppercase, target)):
-        charsets.append(string.ascii_uppercase)
-    if any(map(lambda c: c in string.digits, target)):
-        charsets.append(string.digits)
-    if any(map(lambda c: c in string.punctuation, target)):
-        charsets.append(string.punctuation)
+def alphabet_size(target):
+    mask = 0
+    for c in target:
+        mask |= _CHARSET_BITS.get(c, 0)
+    return _ALPHABET_SIZES[mask]
+
+def _cumulative_results(size, length):
+    table = _CUMULATIVE_RESULTS.setdefault(size, [0])
+    if len(table) <= length:
+        term = 1
+        for factor in range(size, size + len(table) - 1):
+            term *= factor
+        while len(table) <= length:
+            table.append(table[-1] + term)
+            term *= size + len(table) - 2
+    return table[length]
 
-    alphabet = "".join(charsets)
-    if not alphabet:
+def number_results(target):
+    size = alphabet_size(target)
+    if not size:
         return 0
-    n = 0
-    for length in range(len(target)):
-        n += multicomb(len(alphabet), length) * math.factorial(length)
-    return n
+    return _cumulative_results(size, len(target))
 
 class TIME_IN_NS:
     NANOSECOND = 1
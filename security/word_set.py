@@ -1,5 +1,13 @@
+import array
+import bisect
+import collections
+import itertools
+import mmap
 import os.path
-from functools import partial
+import struct
+import sys
+
+from security.bloom_filter import BloomFilter
 
 
 def can_decode(bytes_, encoding='utf-8'):
@@ -10,24 +18,273 @@ def can_decode(bytes_, encoding='utf-8'):
         return False
 
 
-def prepare_wordset(in_path, out_path=None, is_sorted=False, min_length=1, max_length=16):
+RUN_MEMORY_LIMIT = 256 * 1024 * 1024 # in bytes, shared by all the runs being sorted at once
+_WORD_OVERHEAD = 41 # approximate size of an empty bytes object plus its slot in a list
+_RUN_RECORD = struct.Struct('>H')
+_HEADER_WIDTH = 32 # fixed, so the header can be rewritten once the final word count is known
+
+
+def _read_words(in_f, min_length, max_length):
+    for line in in_f:
+        word = line.rstrip(b'\r\n')
+        if word and min_length <= len(word) <= max_length and can_decode(word):
+            yield word
+
+
+def _write_run(words, path, is_sorted=False):
+    with open(path, 'wb', buffering=1024 * 1024) as run:
+        previous = None
+        for word in (words if is_sorted else sorted(words)):
+            if word != previous:
+                run.write(_RUN_RECORD.pack(len(word)) + word)
+                previous = word
+    return path
+
+
+def _read_run(path):
+    with open(path, 'rb', buffering=1024 * 1024) as run:
+        while True:
+            length = run.read(_RUN_RECORD.size)
+            if not length:
+                return
+            yield run.read(_RUN_RECORD.unpack(length)[0])
+
+
+def _header(word_length, word_count):
+    return (b"%d %d" % (word_length, word_count)).ljust(_HEADER_WIDTH - 1) + b"\n"
+
+
+class _PaddedWriter:
+    def __init__(self, out_f, word_length):
+        self.out_f = out_f
+        self.word_length = word_length
+        out_f.write(_header(word_length, 0))
+
+    def write(self, word):
+        self.out_f.write(word + b'\0' * (self.word_length - len(word)))
+
+    def close(self, word_count):
+        self.out_f.seek(0)
+        self.out_f.write(_header(self.word_length, word_count))
+
+
+def _varint(value):
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _read_varint(data, pos):
+    value, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class _FrontCodedWriter:
+    # every entry is (shared prefix length, suffix length, suffix), the first entry of a block shares nothing
+    def __init__(self, out_f, block_size):
+        self.out_f = out_f
+        self.block_size = block_size
+        self.offsets = array.array('Q')
+        self.position = out_f.write(FrontCodedWordSet.MAGIC)
+        self.previous = b''
+        self.count = 0
+
+    def write(self, word):
+        if self.count % self.block_size:
+            shared = len(os.path.commonprefix((self.previous, word)))
+        else:
+            self.offsets.append(self.position)
+            shared = 0
+        self.position += self.out_f.write(_varint(shared) + _varint(len(word) - shared) + word[shared:])
+        self.previous = word
+        self.count += 1
+
+    def close(self, word_count):
+        offsets = self.offsets
+        if sys.byteorder != 'little':
+            offsets = array.array('Q', offsets)
+            offsets.byteswap()
+        self.out_f.write(offsets.tobytes())
+        self.out_f.write(FrontCodedWordSet.FOOTER.pack(self.block_size, word_count, len(self.offsets), self.position, FrontCodedWordSet.MAGIC[:4]))
+
+
+class _WordStats:
+    def __init__(self):
+        self.length, self.count = 0, 0
+
+    def track(self, words):
+        for word in words:
+            self.length, self.count = max(self.length, len(word)), self.count + 1
+            yield word
+
+
+def _split_into_runs(words, run_dir, run_limit, workers=1, on_spill=lambda: None):
+    from concurrent.futures import ProcessPoolExecutor # pulls in multiprocessing, only building a set needs it
+    runs, pending = [], collections.deque()
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+
+    def _spill(batch):
+        path = os.path.join(run_dir, 'run%d' % (len(runs) + len(pending)))
+        if pool is None:
+            runs.append(_write_run(batch, path))
+        else:
+            # at most one batch per worker in flight, so memory stays within the limit
+            if len(pending) >= workers:
+                runs.append(pending.popleft().result())
+            pending.append(pool.submit(_write_run, batch, path))
+        on_spill()
+
+    try:
+        batch, batch_size = [], 0
+        for word in words:
+            batch.append(word)
+            batch_size += len(word) + _WORD_OVERHEAD
+            if batch_size >= run_limit:
+                _spill(batch)
+                batch, batch_size = [], 0
+        if batch:
+            _spill(batch)
+        runs += [job.result() for job in pending]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return runs
+
+
+def prepare_wordset(in_path, out_path=None, is_sorted=False, min_length=1, max_length=16, bloom=True, false_positive_rate=0.01,
+                    memory_limit=RUN_MEMORY_LIMIT, workers=1, progress=None, temp_dir=None, front_coded=False, block_size=None):
+    # external merge sort: sorted, deduplicated runs are spilled to disk, then merged into the set in a single write pass
+    import heapq
+    import tempfile
     out_path = out_path or (os.path.splitext(in_path)[0] + '.ws')
-    words = partial(map, lambda line: line.rstrip(b'\r\n'))
-    word_length, word_count = 0, 0
-    with open(in_path, 'rb') as in_f:
-        in_words = filter(lambda w: w and min_length <= len(w) <= max_length and can_decode(w), words(in_f))
-        for word in in_words:
-            word_length = max(len(word), word_length or 0)
-            word_count += 1
-        with open(out_path, 'wb') as out_f:
-            out_f.write(b"%d %d\n" % (word_length, word_count))
-            in_f.seek(0)
-            for word in (in_words if is_sorted else sorted(in_words)):
-                block = word + b'\0' * (word_length - len(word))
-                out_f.write(block)
-
-
-class WordSet:
+    report = progress or (lambda stage, done, total: None)
+    total_size = os.path.getsize(in_path)
+    stats = _WordStats()
+    with tempfile.TemporaryDirectory(dir=temp_dir) as run_dir:
+        with open(in_path, 'rb') as in_f:
+            words = stats.track(_read_words(in_f, min_length, max_length))
+            if is_sorted:
+                runs = [_write_run(words, os.path.join(run_dir, 'run0'), is_sorted=True)]
+            else:
+                runs = _split_into_runs(words, run_dir, memory_limit // max(workers, 1), workers,
+                                        on_spill=lambda: report('split', in_f.tell(), total_size))
+        report('split', total_size, total_size)
+
+        word_filter = BloomFilter.for_capacity(stats.count, false_positive_rate) if bloom else None
+        unique_count, previous = 0, None
+        with open(out_path, 'wb', buffering=1024 * 1024) as out_f:
+            if front_coded:
+                writer = _FrontCodedWriter(out_f, block_size or FrontCodedWordSet.BLOCK_SIZE)
+            else:
+                writer = _PaddedWriter(out_f, stats.length)
+            for word in heapq.merge(*map(_read_run, runs)):
+                if word == previous:
+                    continue
+                previous = word
+                writer.write(word)
+                if word_filter is not None:
+                    word_filter.add(word)
+                unique_count += 1
+                if not unique_count % 100000:
+                    report('merge', unique_count, stats.count)
+            writer.close(unique_count)
+        report('merge', unique_count, unique_count)
+    if word_filter is not None:
+        word_filter.tag = _bloom_tag(out_path, unique_count)
+        word_filter.save(bloom_sidecar_path(out_path))
+    return unique_count
+
+
+def bloom_sidecar_path(path):
+    return path + '.bloom'
+
+
+def _bloom_tag(path, word_count):
+    return b"%d-%d" % (os.path.getsize(path), word_count)
+
+
+def build_bloom_sidecar(path, false_positive_rate=0.01):
+    words = open_word_set(path, use_bloom=False)
+    bloom = BloomFilter.for_capacity(words.word_count, false_positive_rate, tag=_bloom_tag(path, words.word_count))
+    for word in words.iter_raw():
+        bloom.add(word)
+    bloom.save(bloom_sidecar_path(path))
+    words.close()
+
+
+def _load_bloom_sidecar(path, word_count):
+    try:
+        bloom = BloomFilter.load(bloom_sidecar_path(path))
+    except (FileNotFoundError, ValueError):
+        return None
+    return bloom if bloom.tag == _bloom_tag(path, word_count) else None
+
+
+def open_word_set(path, **kwargs):
+    try:
+        with open(path, 'rb') as f:
+            is_front_coded = f.read(len(FrontCodedWordSet.MAGIC)) == FrontCodedWordSet.MAGIC
+    except FileNotFoundError:
+        is_front_coded = False
+    return (FrontCodedWordSet if is_front_coded else WordSet)(path, **kwargs)
+
+
+def _gallop(data, offset, length, key, low, high):
+    # index of the first padded word in [low, high) that is >= key, probing low, low+1, low+3, low+7...
+    # before bisecting, so a batch of sorted keys close to each other costs a few probes each
+    step, end = 1, high
+    while low < end:
+        probe = min(low + step - 1, end - 1)
+        start = offset + probe * length
+        if data[start:start + length] < key:
+            low = probe + 1
+            step *= 2
+        else:
+            end = probe
+            break
+    while low < end:
+        middle = (low + end) // 2
+        start = offset + middle * length
+        if data[start:start + length] < key:
+            low = middle + 1
+        else:
+            end = middle
+    return low
+
+
+class _BatchLookup:
+    # subclasses provide _sorted_lookups(keys), yielding (rank, found) for keys sorted in byte order
+
+    def _lookup_many(self, items, use_bloom):
+        keys = [item.encode('utf-8') for item in items]
+        results = [(0, False)] * len(keys)
+        if not self:
+            return results
+        bloom = self._bloom if use_bloom else None
+        order = [index for index, key in enumerate(keys) if bloom is None or key in bloom]
+        order.sort(key=keys.__getitem__)
+        for index, result in zip(order, self._sorted_lookups([keys[index] for index in order])):
+            results[index] = result
+        return results
+
+    def contains_many(self, items):
+        return [found for _, found in self._lookup_many(items, use_bloom=True)]
+
+    def rank_many(self, items):
+        # number of words strictly before every item, in the order the items were given
+        return [rank for rank, _ in self._lookup_many(items, use_bloom=False)]
+
+
+class WordSet(_BatchLookup):
     class _Words:
         def __init__(self, file, offset, word_length, word_count):
             self.file = file
@@ -44,15 +301,27 @@ class WordSet:
             self.file.seek(self.offset + index * self.word_length)
             return self.file.read(self.word_length).decode('utf-8').rstrip('\0')
 
-    def __init__(self, path):
+    def __init__(self, path, use_mmap=True, use_bloom=True):
+        self._map = self._bloom = None
         try:
             with open(path, 'rb') as f:
                 self._word_length, self._word_count = map(int, f.readline().split())
                 self._offset = f.tell()
+                if use_mmap and self._word_count:
+                    # mapped for the life of the process, lookups then never touch the file API
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
             self._path = path
         except (FileNotFoundError, ValueError):
             self._path = None
             pass
+        if self._path is not None and use_bloom:
+            self._bloom = _load_bloom_sidecar(path, self._word_count)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._bloom = None
 
     def __enter__(self):
         self._file = open(self.path, 'rb')
@@ -65,6 +334,9 @@ class WordSet:
     def __bool__(self):
         return self.path is not None
 
+    def __len__(self):
+        return self._word_count if self else 0
+
     @property
     def path(self):
         return self._path
@@ -77,7 +349,74 @@ class WordSet:
     def word_count(self):
         return self._word_count
 
+    def raw_word(self, index):
+        if index >= self.word_count:
+            raise IndexError('word index out of range')
+        start = self._offset + index * self.word_length
+        if self._map is not None:
+            return self._map[start:start + self.word_length].rstrip(b'\0')
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(self.word_length).rstrip(b'\0')
+
+    def iter_raw(self, chunk_words=4096):
+        if self._map is None:
+            yield from map(self.raw_word, range(self.word_count))
+            return
+        length = self.word_length
+        for first in range(0, self.word_count, chunk_words):
+            start = self._offset + first * length
+            chunk = self._map[start:start + min(chunk_words, self.word_count - first) * length]
+            for position in range(0, len(chunk), length):
+                yield chunk[position:position + length].rstrip(b'\0')
+
+    def _contains_mapped(self, item):
+        # padding with NULs keeps byte order identical to the order the words were sorted in
+        key = item.encode('utf-8')
+        if len(key) > self.word_length or b'\0' in key:
+            return False
+        if self._bloom is not None and key not in self._bloom:
+            return False
+        key += b'\0' * (self.word_length - len(key))
+        words, offset, length = self._map, self._offset, self.word_length
+        min_idx, max_idx = 0, self.word_count
+        while max_idx > min_idx:
+            mid_idx = (max_idx + min_idx) // 2
+            start = offset + mid_idx * length
+            mid_word = words[start:start + length]
+            if key == mid_word:
+                return True
+            elif key < mid_word:
+                max_idx = mid_idx
+            else:
+                min_idx = mid_idx + 1
+        return False
+
+    def _sorted_lookups(self, keys):
+        data = self._map
+        if data is None:
+            with open(self.path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset, length, count = self._offset, self.word_length, self.word_count
+        try:
+            low = 0
+            for key in keys:
+                # padding with NULs keeps the byte order of the words, a key too long to be stored is ranked
+                # right after the words it starts with
+                padded = key[:length] + b'\0' * (length - len(key))
+                low = _gallop(data, offset, length, padded, low, count)
+                start = offset + low * length
+                if len(key) > length or b'\0' in key:
+                    while low < count and data[start:start + length].rstrip(b'\0') < key:
+                        low, start = low + 1, start + length
+                yield low, low < count and data[start:start + length].rstrip(b'\0') == key
+        finally:
+            if data is not self._map:
+                data.close()
+
     def __contains__(self, item):
+        if self._map is not None:
+            return self._contains_mapped(item)
         if self:
             min_idx, max_idx = 0, self.word_count
             with self as words:
@@ -93,7 +432,112 @@ class WordSet:
         return False
 
     def __getitem__(self, item):
+        if self._map is not None:
+            return self.raw_word(item).decode('utf-8')
         with self as words:
             return words[item]
 
 
+
+
+
+class FrontCodedWordSet(_BatchLookup):
+    MAGIC = b'FCWS1\n'
+    FOOTER = struct.Struct('<IQQQ4s') # block size, word count, block count, block offsets position, magic
+    BLOCK_SIZE = 32
+
+    def __init__(self, path, use_bloom=True):
+        self._map = self._bloom = None
+        self._path = None
+        self._word_count = 0
+        try:
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:len(self.MAGIC)] != self.MAGIC:
+                raise ValueError(f"{path} is not a front-coded word set")
+            self._block_size, self._word_count, block_count, self._index_offset, _ = \
+                self.FOOTER.unpack_from(self._map, len(self._map) - self.FOOTER.size)
+            self._offsets = array.array('Q', self._map[self._index_offset:self._index_offset + 8 * block_count])
+            if sys.byteorder != 'little':
+                self._offsets.byteswap()
+            # the only in-memory index: the first word of every block, which is stored whole
+            self._first_words = [self._decode_entry(b'', offset)[0] for offset in self._offsets]
+            self._path = path
+        except (FileNotFoundError, ValueError, struct.error):
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+        if self._path is not None and use_bloom:
+            self._bloom = _load_bloom_sidecar(path, self._word_count)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._bloom = None
+
+    def __bool__(self):
+        return self.path is not None
+
+    def __len__(self):
+        return self._word_count
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def word_count(self):
+        return self._word_count
+
+    def _decode_entry(self, previous, pos):
+        shared, pos = _read_varint(self._map, pos)
+        length, pos = _read_varint(self._map, pos)
+        return previous[:shared] + self._map[pos:pos + length], pos + length
+
+    def _block_words(self, block):
+        pos = self._offsets[block]
+        end = self._offsets[block + 1] if block + 1 < len(self._offsets) else self._index_offset
+        word = b''
+        while pos < end:
+            word, pos = self._decode_entry(word, pos)
+            yield word
+
+    def iter_raw(self):
+        for block in range(len(self._offsets) if self else 0):
+            yield from self._block_words(block)
+
+    def _sorted_lookups(self, keys):
+        block, words = -1, ()
+        for key in keys:
+            key_block = bisect.bisect_right(self._first_words, key, max(block, 0)) - 1
+            if key_block < 0:
+                yield 0, False
+                continue
+            if key_block != block:
+                block, words = key_block, list(self._block_words(key_block))
+            position = bisect.bisect_left(words, key)
+            yield block * self._block_size + position, position < len(words) and words[position] == key
+
+    def raw_word(self, index):
+        if not 0 <= index < self._word_count:
+            raise IndexError('word index out of range')
+        block, position = divmod(index, self._block_size)
+        return next(itertools.islice(self._block_words(block), position, None))
+
+    def __getitem__(self, index):
+        return self.raw_word(index).decode('utf-8')
+
+    def __contains__(self, item):
+        if not self:
+            return False
+        key = item.encode('utf-8')
+        if self._bloom is not None and key not in self._bloom:
+            return False
+        block = bisect.bisect_right(self._first_words, key) - 1
+        if block < 0:
+            return False
+        for word in self._block_words(block):
+            if word >= key:
+                return word == key
+        return False
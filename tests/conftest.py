@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from persistence import kdf
+from persistence.database import DatabaseManager
+from persistence.encryption import Encryption
+
+MASTER_PASSWORD = 'master password'
+
+
+@pytest.fixture
+def master_password():
+    return MASTER_PASSWORD
+
+
+@pytest.fixture
+def vault(tmp_path):
+    # fixed KDF parameters, calibrating would make every test pay for it
+    db = DatabaseManager(os.path.join(tmp_path, 'vault.db'))
+    encryption = Encryption(db)
+    encryption.update_password(MASTER_PASSWORD, kdf_params=kdf.DEFAULT_KDF_PARAMS)
+    yield db, encryption
+    db.close()
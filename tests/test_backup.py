@@ -0,0 +1,63 @@
+import os
+
+import cryptography.fernet
+import pytest
+
+from persistence import backup, kdf
+from persistence.database import DatabaseManager
+
+FAST_PBKDF2 = kdf.KDF_PARAMS(kdf.PBKDF2, 1000, 0)
+FAST_SCRYPT = kdf.KDF_PARAMS(kdf.SCRYPT, 1, 2 ** 10)
+ROWS = [DatabaseManager.ROW_TUPLE(f"entry {i}", f"user{i}@example.com", f"password {i}", f"https://{i}.example")
+        for i in range(10)]
+
+
+@pytest.mark.parametrize('kdf_params', [FAST_PBKDF2, FAST_SCRYPT])
+def test_backup_round_trip_with_the_stored_kdf_params(vault, tmp_path, kdf_params):
+    db, encryption = vault
+    db.import_many(ROWS, encrypt=encryption.encrypt)
+    path = os.path.join(tmp_path, 'vault.backup')
+    assert backup.export_backup(db, encryption, path, 'passphrase', chunk_rows=3, kdf_params=kdf_params) == len(ROWS)
+    assert backup.is_backup(path)
+    assert sorted(backup.read_backup(path, 'passphrase')) == sorted(ROWS)
+    with pytest.raises(backup.BackupError):
+        list(backup.read_backup(path, 'wrong passphrase'))
+
+
+def test_backups_with_only_pbkdf2_iterations_are_restored(tmp_path):
+    path = os.path.join(tmp_path, 'legacy.backup')
+    salt = os.urandom(backup.SALT_LENGTH)
+    fernet = cryptography.fernet.Fernet(backup.derive_backup_key('passphrase', salt, FAST_PBKDF2))
+    chunk = fernet.encrypt(backup._CHUNK_HEADER.pack(0, False) + b'{"name": "legacy", "password": "secret"}')
+    last = fernet.encrypt(backup._CHUNK_HEADER.pack(1, True))
+    with open(path, 'wb') as f:
+        f.write(backup.LEGACY_MAGIC + salt + backup._UINT32.pack(FAST_PBKDF2.iterations))
+        for token in (chunk, last):
+            f.write(backup._UINT32.pack(len(token)) + token)
+    assert backup.is_backup(path)
+    assert list(backup.read_backup(path, 'passphrase')) == [DatabaseManager.ROW_TUPLE('legacy', '', 'secret', '')]
+
+
+def test_truncated_header_is_reported(tmp_path):
+    path = os.path.join(tmp_path, 'truncated.backup')
+    with open(path, 'wb') as f:
+        f.write(backup.MAGIC + os.urandom(backup.SALT_LENGTH) + b'pbkdf2')
+    with pytest.raises(backup.BackupError):
+        list(backup.read_backup(path, 'passphrase'))
+
+
+@pytest.mark.parametrize('kdf_params', [
+    kdf.KDF_PARAMS(kdf.PBKDF2, 0, 0),
+    kdf.KDF_PARAMS(kdf.PBKDF2, 0xFFFFFFFF, 0),
+    kdf.KDF_PARAMS(kdf.SCRYPT, 1, 2 ** 30),
+    kdf.KDF_PARAMS(kdf.SCRYPT, 1, 3000),
+    kdf.KDF_PARAMS(kdf.SCRYPT, 0, 2 ** 10),
+    kdf.KDF_PARAMS('unknown', 1, 0),
+])
+def test_unreasonable_kdf_params_in_the_header_are_rejected(tmp_path, kdf_params):
+    path = os.path.join(tmp_path, 'crafted.backup')
+    with open(path, 'wb') as f:
+        f.write(backup.MAGIC + os.urandom(backup.SALT_LENGTH)
+                + backup._KDF_HEADER.pack(kdf_params.algorithm.encode('ascii'), kdf_params.iterations, kdf_params.memory_cost))
+    with pytest.raises(backup.BackupError, match="Invalid backup header"):
+        list(backup.read_backup(path, 'passphrase'))
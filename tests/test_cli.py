@@ -0,0 +1,59 @@
+import getpass
+import json
+import os
+
+import pytest
+
+import cli
+
+
+@pytest.fixture
+def vault_path(vault, master_password, monkeypatch):
+    db, _ = vault
+    monkeypatch.setenv(cli.PASSWORD_ENV, master_password)
+    return db.path
+
+
+def test_missing_import_file_is_reported(vault_path, tmp_path, capsys):
+    assert cli.main(['--db', vault_path, 'import', os.path.join(tmp_path, 'missing.csv')]) == 1
+    assert 'No such file or directory' in capsys.readouterr().err
+
+
+def test_json_import_of_non_objects_is_reported(vault_path, tmp_path, capsys):
+    path = os.path.join(tmp_path, 'entries.json')
+    with open(path, 'w') as f:
+        json.dump([{'name': 'ok'}, 'not an object'], f)
+    assert cli.main(['--db', vault_path, 'import', path]) == 1
+    assert 'Expected one object per entry' in capsys.readouterr().err
+
+
+def test_end_of_input_at_the_password_prompt_is_reported(vault_path, monkeypatch, capsys):
+    monkeypatch.delenv(cli.PASSWORD_ENV)
+
+    def _eof(prompt=''):
+        raise EOFError()
+    monkeypatch.setattr(getpass, 'getpass', _eof)
+    assert cli.main(['--db', vault_path, 'add', 'entry', '--generate', '12']) == 1
+    assert capsys.readouterr().err == "error: no input\n"
+
+
+def test_interrupted_prompt_exits_with_130(vault_path, monkeypatch):
+    monkeypatch.delenv(cli.PASSWORD_ENV)
+
+    def _interrupt(prompt=''):
+        raise KeyboardInterrupt()
+    monkeypatch.setattr(getpass, 'getpass', _interrupt)
+    assert cli.main(['--db', vault_path, 'add', 'entry', '--generate', '12']) == 130
+
+
+def test_refused_changes_are_reported(vault_path, capsys):
+    assert cli.main(['--db', vault_path, 'add', '', '--generate', '8']) == 1
+    assert capsys.readouterr().err == "error: Please fill in a name!\n"
+
+
+def test_generated_password_length_must_be_positive(vault_path, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['--db', vault_path, 'add', 'x1', '--generate', '0'])
+    assert exit_info.value.code == 2
+    assert 'must be at least 1' in capsys.readouterr().err
+    assert cli.main(['--db', vault_path, 'add', 'x1', '--generate', '8']) == 0
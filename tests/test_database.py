@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from persistence.database import DatabaseManager
+
+ROW = DatabaseManager.ROW_TUPLE('inner', 'me@example.com', 'sealed', 'https://example.com')
+OTHER = DatabaseManager.ROW_TUPLE('outer', 'me@example.com', 'sealed', 'https://example.com')
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'vault.db'))
+    yield db
+    db.close()
+
+
+def test_nested_cursor_is_rolled_back_with_an_outer_cursor_that_only_read(db):
+    with pytest.raises(RuntimeError):
+        with db.cursor() as cursor:
+            cursor.fetch("SELECT * FROM manager")
+            db.submit(ROW)
+            raise RuntimeError()
+    assert not db.exists(ROW.name)
+
+
+def test_nested_cursor_is_rolled_back_with_an_outer_cursor_that_wrote(db):
+    with pytest.raises(RuntimeError):
+        with db.cursor() as cursor:
+            cursor.execute("INSERT INTO manager VALUES (?, ?, ?, ?)", OTHER)
+            db.submit(ROW)
+            raise RuntimeError()
+    assert not db.exists(ROW.name)
+    assert not db.exists(OTHER.name)
+
+
+def test_nested_cursor_is_committed_with_the_outer_cursor(db):
+    with db.cursor() as cursor:
+        cursor.fetch("SELECT * FROM manager")
+        db.submit(ROW)
+    assert db.exists(ROW.name)
+
+
+def test_failed_nested_cursor_only_rolls_back_its_own_work(db):
+    with db.cursor() as cursor:
+        cursor.execute("INSERT INTO manager VALUES (?, ?, ?, ?)", OTHER)
+        with pytest.raises(RuntimeError):
+            with db.cursor() as inner:
+                inner.execute("INSERT INTO manager VALUES (?, ?, ?, ?)", ROW)
+                raise RuntimeError()
+    assert db.exists(OTHER.name)
+    assert not db.exists(ROW.name)
+
+
+def test_row_cache_over_budget_stays_disabled_after_a_rollback(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'vault.db'), row_cache_budget=1)
+    db.submit(ROW)
+    assert db.exists(ROW.name)
+    assert not db._row_cache_enabled
+    with pytest.raises(RuntimeError):
+        with db.cursor() as cursor:
+            cursor.execute("INSERT INTO manager VALUES (?, ?, ?, ?)", OTHER)
+            raise RuntimeError()
+    assert not db._row_cache_enabled
+    assert db.exists(ROW.name)
+    db.invalidate_cache()
+    assert db._row_cache_enabled
+    db.close()
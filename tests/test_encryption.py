@@ -0,0 +1,39 @@
+import os
+
+from persistence import database, kdf
+from persistence.database import DatabaseManager
+from persistence.encryption import Encryption, FernetPasswordCipher
+
+
+def test_legacy_migration_keeps_the_legacy_kdf_cost(tmp_path):
+    db = DatabaseManager(os.path.join(tmp_path, 'vault.db'))
+    salt = os.urandom(database.SALT_LENGTH)
+    with db.cursor() as cursor:
+        cursor.execute("INSERT INTO master_pwd VALUES (:hash)", {'hash': salt + database.hash_password('master', salt)})
+    assert Encryption(db).unlock('master')
+    assert not db.is_master_pwd_legacy()
+    assert db.get_kdf_params() == kdf.DEFAULT_KDF_PARAMS
+    assert Encryption(db).unlock('master')
+    db.close()
+
+
+def test_records_are_only_upgraded_once(tmp_path, monkeypatch):
+    db = DatabaseManager(os.path.join(tmp_path, 'vault.db'))
+    encryption = Encryption(db)
+    encryption.update_password('master', kdf_params=kdf.DEFAULT_KDF_PARAMS)
+    with db.cursor() as cursor:
+        cursor.execute("DELETE FROM keyring WHERE name = ?", (Encryption.RECORDS_UPGRADED_ENTRY,))
+    legacy = FernetPasswordCipher('master')
+    db.submit(db.ROW_TUPLE('legacy', '', legacy.encrypt(b'secret'), ''))
+    db.submit(db.ROW_TUPLE('broken', '', os.urandom(64), ''))
+
+    reciphered = []
+    recipher = db.recipher
+    monkeypatch.setattr(db, 'recipher', lambda *args, **kwargs: reciphered.append(recipher(*args, **kwargs)))
+    encryption = Encryption(db)
+    assert encryption.unlock('master')
+    assert reciphered == [1]
+    assert encryption.decrypt(db.fetch_one('legacy').password) == 'secret'
+    assert Encryption(db).unlock('master')
+    assert reciphered == [1]
+    db.close()
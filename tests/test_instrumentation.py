@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+import instrumentation
+from persistence import kdf
+from persistence.encryption import Encryption
+
+
+@pytest.fixture
+def instrumented(tmp_path):
+    instrumentation.reset()
+    instrumentation.enable(os.path.join(tmp_path, 'instrumentation.json'))
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_unlock_and_fetches_are_recorded(vault, master_password, instrumented):
+    db, _ = vault
+    db.submit(db.ROW_TUPLE('entry', 'me@example.com', 'sealed', 'https://example.com'))
+    assert Encryption(db).unlock(master_password, migrate=False)
+    db.exists('entry')
+    db.fetch_one('entry')
+    list(db.iter_rows())
+    timings = instrumentation.snapshot()
+    assert timings['kdf.derive']['count'] == 1
+    assert timings['Cursor.fetch']['count'] >= 2
+    assert timings['Cursor.fetch_many']['count'] >= 1
+
+
+def test_disable_restores_the_originals(instrumented):
+    instrumentation.disable()
+    assert kdf.derive.__module__ == 'persistence.kdf' and not hasattr(kdf.derive, '__wrapped__')
@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+
+from security.password_strength import PasswordStrength, StrengthEvaluator
+
+
+class FakeBar:
+    def __init__(self):
+        self.values = []
+
+    def set_value(self, value):
+        self.values.append(value)
+
+
+class FakeWidget:
+    # stands in for the Tk frame, every Tk call has to come from the thread that created it
+    POLL_INTERVAL = PasswordStrength.POLL_INTERVAL
+    update_bar = PasswordStrength.update_bar
+    _poll = PasswordStrength._poll
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.bar = FakeBar()
+        self._generation = 0
+        self._waiting_for = None
+        self._results = queue.Queue()
+        self._poll_id = None
+        self.scheduled = []
+        self.tk_thread = threading.get_ident()
+
+    def after(self, ms, func):
+        assert threading.get_ident() == self.tk_thread, "Tk called from the worker thread"
+        self.scheduled.append(func)
+        return len(self.scheduled)
+
+    def run_scheduled(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.scheduled and time.monotonic() < deadline:
+            self.scheduled.pop(0)()
+            time.sleep(0.01)
+
+
+def test_worker_result_reaches_the_bar_through_the_tk_thread():
+    widget = FakeWidget(StrengthEvaluator(evaluate=len))
+    widget.update_bar('secret')
+    widget.run_scheduled()
+    assert widget.bar.values == [6]
+    assert widget._poll_id is None
+
+
+def test_superseded_results_are_not_shown():
+    release = threading.Event()
+
+    def evaluate(password):
+        release.wait(5)
+        return len(password)
+    widget = FakeWidget(StrengthEvaluator(evaluate=evaluate))
+    widget.update_bar('first')
+    widget.update_bar('second one')
+    release.set()
+    widget.run_scheduled()
+    assert widget.bar.values[-1] == 10
+    assert 5 not in widget.bar.values
+
+
+def test_cached_value_is_shown_inline():
+    evaluator = StrengthEvaluator(evaluate=len)
+    widget = FakeWidget(evaluator)
+    widget.update_bar('secret')
+    widget.run_scheduled()
+    widget.update_bar('secret')
+    assert widget.bar.values == [6, 6]
+    assert widget.scheduled == []
+
+
+def test_failing_evaluation_falls_back_and_keeps_the_worker_alive():
+    def evaluate(password):
+        raise PermissionError("rockyou_9-16.ws")
+    evaluator = StrengthEvaluator(evaluate=evaluate, fallback=lambda password: -len(password))
+    widget = FakeWidget(evaluator)
+    widget.update_bar('secret')
+    widget.run_scheduled()
+    widget.update_bar('longer secret')
+    widget.run_scheduled()
+    assert widget.bar.values == [-6, -13]
+    assert widget._poll_id is None
+    assert evaluator.cached('secret') is None
@@ -0,0 +1,39 @@
+from ui.search_index import SearchIndex, SearchPipeline
+
+
+def make_index():
+    index = SearchIndex()
+    index.add('google', ('google', 'me@gmail.com', 'https://google.com'))
+    index.add('github', ('github', 'dev@example.com', 'https://github.com'))
+    index.add('bank', ('bank', 'me@example.com', ''))
+    return index
+
+
+def test_query_matches_substrings():
+    index = make_index()
+    assert index.query('goo') == {'google'}
+    assert index.query('example') == {'github', 'bank'}
+    assert index.query('') == {'google', 'github', 'bank'}
+
+
+def test_query_with_unknown_trigram_has_no_match():
+    index = make_index()
+    assert index.query('xyz') == set()
+    assert index.query('xyz qqq') == set()
+    assert index.query('googlx') == set()
+
+
+def test_pipeline_refines_cached_query_into_no_match():
+    pipeline = SearchPipeline(make_index())
+    assert pipeline.query('') == {'google', 'github', 'bank'}
+    assert pipeline.query('goo') == {'google'}
+    assert pipeline.query('goox') == set()
+    assert pipeline.query('goo xyz') == set()
+    assert pipeline.query('goo') == {'google'}
+
+
+def test_pipeline_refinement_matches_a_fresh_query():
+    index = make_index()
+    pipeline = SearchPipeline(index)
+    for query in ('', 'g', 'gi', 'git', 'gith', 'githu', 'github', 'githubx', 'e', 'ex', 'exa', 'exam me'):
+        assert pipeline.query(query) == SearchIndex.query(index, query)
@@ -0,0 +1,30 @@
+import math
+from itertools import combinations
+
+import pytest
+
+from security.time_cracker import CHARSETS, number_results
+
+
+def reference_number_results(target):
+    # the formula the cumulative table replaced
+    alphabet = ''.join(charset for charset in CHARSETS if any(c in charset for c in target))
+    if not alphabet:
+        return 0
+    return sum(math.comb(len(alphabet) + length - 1, length) * math.factorial(length) for length in range(len(target)))
+
+
+@pytest.mark.parametrize('charsets', [charsets for count in range(1, len(CHARSETS) + 1) for charsets in combinations(CHARSETS, count)])
+def test_number_results_matches_the_reference_formula(charsets):
+    # every charset is touched as soon as the password is long enough to
+    alphabet = ''.join(''.join(chars) for chars in zip(*charsets))
+    for length in range(0, 129):
+        target = (alphabet * (length // len(alphabet) + 1))[:length]
+        assert number_results(target) == reference_number_results(target), (charsets, length)
+
+
+def test_characters_outside_the_charsets_are_ignored():
+    assert number_results('') == 0
+    assert number_results('éèà') == 0
+    assert number_results('abcé') == reference_number_results('abcé')
+    assert number_results('aB3!' + ' ' * 12) == reference_number_results('aB3!' + ' ' * 12)
@@ -1,14 +1,28 @@
 import tkinter as tk
 
-from captcha.image import ImageCaptcha
 from ui.entry import ClipboardEntry
-from PIL import ImageTk
 from security.utils import generate_captcha_string
 from tkinter import ttk
 
+# captcha and PIL are the slowest imports of the application, they are loaded when the first image is drawn
+# (or earlier by preload, from a background thread) so the unlock prompt doesn't wait for them
+PRELOADED_MODULES = ('captcha.image', 'PIL.ImageTk')
+
+
+def preload():
+    import importlib
+    import threading
+
+    def _import():
+        for module in PRELOADED_MODULES:
+            importlib.import_module(module)
+    threading.Thread(target=_import, name="captcha-preload", daemon=True).start()
+
+
 class Captcha(ttk.Frame):
     def __init__(self, parent):
-        self.captcha = ImageCaptcha()
+        self.captcha = None
+        self.result = None
         super().__init__(parent)
         self.label = ttk.Label(self)
         self.entry = ClipboardEntry(self, width=10)
@@ -17,9 +31,13 @@ class Captcha(ttk.Frame):
         
         ttk.Button(self, text="refresh", command=self.refresh).grid(row=0, column=5, columnspan=1)
         
-        self.refresh()
+        self.after_idle(self.refresh) # the dialog is drawn first, the image right after
     
     def refresh(self):
+        if self.captcha is None:
+            from captcha.image import ImageCaptcha
+            self.captcha = ImageCaptcha()
+        from PIL import ImageTk
         self.result = generate_captcha_string()
         image = self.captcha.generate_image(self.result)
         self.image = ImageTk.PhotoImage(image)
@@ -27,6 +45,6 @@ class Captcha(ttk.Frame):
         self.entry.delete(0, tk.END)
     
     def validate(self):
-        result = self.result == self.entry.get()
+        result = self.result is not None and self.result == self.entry.get()
         self.entry.delete(0, tk.END)
-        return result
\ No newline at end of file
+        return result
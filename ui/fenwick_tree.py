@@ -0,0 +1,40 @@
+class FenwickTree:
+    def __init__(self, size=0):
+        self._values = [0] * size
+        self._tree = [0] * (size + 1)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def __setitem__(self, index, value):
+        if index >= len(self._values):
+            self._grow(max(index + 1, 2 * len(self._values)))
+        delta = value - self._values[index]
+        if delta:
+            self._values[index] = value
+            i = index + 1
+            while i < len(self._tree):
+                self._tree[i] += delta
+                i += i & -i
+
+    def _grow(self, size):
+        self._values += [0] * (size - len(self._values))
+        self._tree = [0] + self._values
+        for i in range(1, len(self._tree)): # linear-time rebuild
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def prefix_sum(self, stop):
+        # sum of the values in [0, stop)
+        total, i = 0, min(stop, len(self._values))
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def total(self):
+        return self.prefix_sum(len(self._values))
@@ -61,6 +61,7 @@ class Form(ttk.Frame):
         
         db.on_submit.append( self.update_btn_visibility )
         db.on_delete.append( self.update_btn_visibility )
+        db.on_import.append( self.update_btn_visibility )
         
         
     def add_field(self, field_descriptor):
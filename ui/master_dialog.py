@@ -99,11 +99,22 @@ class MasterDialogCheck(MasterDialogBase):
         if not self.captcha.validate():
             self.set_error_message("Invalid captcha!")
             return False
-        elif not self.db.check_master_pwd(self.entry.get()):
+        elif not self._unlock():
             self.set_error_message("Invalid password!")
             return False
         return True
 
+    def _unlock(self):
+        try:
+            return self.encryption.unlock(self.entry.get())
+        except:
+            messagebox.showerror(title="Failure", message=f"Failed to unlock the vault. Operation aborted.")
+            raise
+
+    def apply(self):
+        # the vault was already unlocked while validating, deriving the key a second time is what we avoid
+        self.password_var.set('\0' * len(self.password_var.get()))
+
     def cancel(self, event=None):
         self.parent.destroy()
 
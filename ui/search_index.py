@@ -0,0 +1,108 @@
+from collections import defaultdict, OrderedDict
+
+
+class SearchIndex:
+    GRAM_LENGTH = 3
+    FIELD_SEPARATOR = '\n' # search tokens are whitespace-split, so no token can match across fields
+
+    def __init__(self):
+        self._rows = {}
+        self._postings = defaultdict(set)
+        self.version = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def names(self):
+        return self._rows.keys()
+
+    @classmethod
+    def _grams(cls, text):
+        n = cls.GRAM_LENGTH
+        return set(text[i:i + n] for i in range(len(text) - n + 1))
+
+    def add(self, name, fields):
+        self.remove(name)
+        text = self.FIELD_SEPARATOR.join(fields)
+        self._rows[name] = text
+        self.version += 1
+        for gram in self._grams(text):
+            self._postings[gram].add(name)
+
+    def remove(self, name):
+        text = self._rows.pop(name, None)
+        if text is not None:
+            self.version += 1
+            for gram in self._grams(text):
+                posting = self._postings[gram]
+                posting.discard(name)
+                if not posting:
+                    del self._postings[gram]
+
+    def _postings_of(self, token):
+        if len(token) < self.GRAM_LENGTH:
+            return None
+        return sorted((self._postings.get(gram, frozenset()) for gram in self._grams(token)), key=len)
+
+    def query(self, search_string, candidates=None):
+        tokens = [(token, self._postings_of(token)) for token in set(search_string.split())]
+        # the most selective tokens go first so the candidate set shrinks as fast as possible,
+        # short tokens have no postings and are only checked against what is left
+        tokens.sort(key=lambda item: len(item[1][0]) if item[1] is not None else len(self._rows) + 1)
+        rows, matches = self._rows, candidates
+        for token, postings in tokens:
+            if postings is None:
+                pool = rows.keys() if matches is None else matches
+            else:
+                pool = set(postings[0]) if matches is None else matches & postings[0]
+                for posting in postings[1:]:
+                    if not pool:
+                        break
+                    pool &= posting
+                if len(token) == self.GRAM_LENGTH:
+                    matches = pool # the posting of a single gram is exact
+                    continue
+            matches = set(name for name in pool if token in rows[name])
+            if not matches:
+                break
+        return set(self._rows) if matches is None else matches
+
+
+class SearchPipeline:
+    CACHE_SIZE = 16
+
+    def __init__(self, index, cache_size=CACHE_SIZE):
+        self.index = index
+        self.cache_size = cache_size
+        self._results = OrderedDict() # recent queries, most recent last
+        self._index_version = index.version
+
+    @staticmethod
+    def _normalize(search_string):
+        return tuple(sorted(set(search_string.split())))
+
+    @staticmethod
+    def _refines(tokens, previous_tokens):
+        # a row matching every new token also matches every previous one it contains
+        return all(any(previous in token for token in tokens) for previous in previous_tokens)
+
+    def _narrowest_cached_superset(self, tokens):
+        supersets = [result for previous, result in self._results.items() if self._refines(tokens, previous)]
+        return min(supersets, key=len, default=None)
+
+    def query(self, search_string):
+        if self._index_version != self.index.version:
+            self._results.clear()
+            self._index_version = self.index.version
+        tokens = self._normalize(search_string)
+        result = self._results.get(tokens)
+        if result is None:
+            result = self.index.query(search_string, candidates=self._narrowest_cached_superset(tokens))
+            self._results[tokens] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        self._results.move_to_end(tokens)
+        return result
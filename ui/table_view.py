@@ -1,12 +1,15 @@
 import tkinter as tk
 
 from ui.context_menu import RightClickMenu
+from ui.fenwick_tree import FenwickTree
+from ui.search_index import SearchIndex, SearchPipeline
 from persistence.data import FIELDS
 from tkinter import ttk
 
 
 class TableView(ttk.Treeview):
     COLUMNS = tuple(filter(lambda col: col != "#0", map(lambda field: field['tree_column'], FIELDS)))
+    SEARCH_DEBOUNCE_MS = 120
     
     def match_search_string(search_string, row):
         search_tokens = search_string.split()
@@ -18,14 +21,17 @@ class TableView(ttk.Treeview):
         self.total_insert_call_count = 0
         self.insert_order = {}
         self.hidden = set()
+        self.visible_by_order = FenwickTree() # 1 for each attached item, indexed by insert order
+        self.search_index = SearchIndex()
+        self.search_pipeline = SearchPipeline(self.search_index)
+        self._search_job = None
         self.db = db
         self._on_select = on_select
         self._last_selected = None
         for field in FIELDS:
             self.column(field['tree_column'], anchor=tk.CENTER, minwidth=50, width=0, stretch=tk.YES)
             self.heading(field['tree_column'], text=field['name'])
-        for fields in db.fetch_all():
-            self.insert("", 0, fields.name, text=fields.name, values=self._fields_to_values(fields))
+        self.populate()
         self.context_menu = RightClickMenu(self, db, func_decipher_private)
 
         self.bind("<Button-3>", self.show_context_menu)
@@ -34,6 +40,12 @@ class TableView(ttk.Treeview):
         db.on_submit.append( self.prepend )
         db.on_delete.append( self.delete )
         db.on_update.append( self.update_fields )
+        db.on_bulk_update.append( self.update_many )
+        db.on_import.append( self.import_rows )
+
+    def populate(self):
+        for fields in self.db.fetch_all():
+            self.insert("", 0, fields.name, text=fields.name, values=self._fields_to_values(fields))
 
     def _on_treeview_select(self, event):
         self._last_selected = self.get_selected_name()
@@ -43,24 +55,41 @@ class TableView(ttk.Treeview):
         for item in items:
             if item in self.hidden:
                 self.hidden.remove(item)
+            order = self.insert_order.pop(item, None)
+            if order is not None:
+                self.visible_by_order[order] = 0
+            self.search_index.remove(item)
         super().delete(*items)
+
+    def _visible_index(self, item):
+        # items are only ever prepended, so the visible items above us are exactly those inserted after us
+        return self.visible_by_order.total() - self.visible_by_order.prefix_sum(self.insert_order[item] + 1)
     
     def show(self, item):
-        if item in self.hidden:
-            if self.exists(item):
-                # these should be above us since they were added after and we only prepend
-                visible_items_inserted_after = filter(lambda name: name not in self.hidden and self.insert_order[name] > self.insert_order[item], self.insert_order)
-                next_neighbour = min(visible_items_inserted_after, default=None, key=lambda name: self.insert_order[name]) # should be right above us
-                index = self.index(next_neighbour) + 1 if next_neighbour is not None else 0
-                self.reattach(item, '', index)
-                self.hidden.remove(item)
-            else:
+        self.show_many((item,))
+
+    def show_many(self, items):
+        for item in items:
+            if item in self.hidden and not self.exists(item):
                 raise ValueError("Something went wrong! Item was deleted from the table view but remains in self.hidden.")
+        items = sorted((item for item in set(items) if item in self.hidden), key=self.insert_order.get, reverse=True)
+        for item in items:
+            self.hidden.remove(item)
+            self.visible_by_order[self.insert_order[item]] = 1
+        # topmost first, so every item above the one being reattached is already in place
+        for item in items:
+            self.reattach(item, '', self._visible_index(item))
     
     def hide(self, item):
-        if item not in self.hidden and self.exists(item):
+        self.hide_many((item,))
+
+    def hide_many(self, items):
+        items = [item for item in set(items) if item not in self.hidden and self.exists(item)]
+        for item in items:
             self.hidden.add(item)
-            self.detach(item)
+            self.visible_by_order[self.insert_order[item]] = 0
+        if items:
+            self.detach(*items)
             
     def set_visible(self, item, visible):
         if visible:
@@ -68,12 +97,20 @@ class TableView(ttk.Treeview):
         else:
             self.hide(item)
             
+    def search(self, search_string):
+        # coalesce bursts of keystrokes into a single filter pass
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(self.SEARCH_DEBOUNCE_MS, self._run_search, search_string)
+
+    def _run_search(self, search_string):
+        self._search_job = None
+        self.filter_by_search_string(search_string)
+
     def filter_by_search_string(self, search_string):
-        all_rows = self.get_children() + tuple(self.hidden)
-        is_visible = lambda row: TableView.match_search_string(search_string, row)
-        for name in all_rows:
-            row = (name,) + self.item(name, option='values')
-            self.set_visible(name, is_visible(row))
+        matches = self.search_pipeline.query(search_string)
+        self.hide_many(self.search_index.names() - self.hidden - matches)
+        self.show_many(self.hidden & matches)
         
     def selection_clear(self):
         for item in self.selection():
@@ -91,7 +128,9 @@ class TableView(ttk.Treeview):
     def insert(self, parent, index, iid, *args, **kwargs):
         super().insert(parent, index, iid, *args, **kwargs)
         self.insert_order[iid] = self.total_insert_call_count
+        self.visible_by_order[self.total_insert_call_count] = 1
         self.total_insert_call_count += 1
+        self.search_index.add(iid, self._searchable_fields(iid, kwargs.get('values', ())))
     
     def prepend(self, fields):
         self.insert("", 0, fields.name, text=fields.name, values=self._fields_to_values(fields))
@@ -99,7 +138,18 @@ class TableView(ttk.Treeview):
         self.selection_set(fields.name)
         
     def update_fields(self, fields):
-        self.item(fields.name, values=self._fields_to_values(fields))
+        values = self._fields_to_values(fields)
+        self.item(fields.name, values=values)
+        self.search_index.add(fields.name, self._searchable_fields(fields.name, values))
+
+    def update_many(self, rows):
+        for fields in rows:
+            self.update_fields(fields)
+
+    def import_rows(self, report):
+        for fields in report.submitted:
+            self.insert("", 0, fields.name, text=fields.name, values=self._fields_to_values(fields))
+        self.update_many(report.updated)
         
     def show_context_menu(self, event):
         iid = self.identify_row(event.y)
@@ -113,4 +163,8 @@ class TableView(ttk.Treeview):
             self.context_menu.fields = None
         
     def _fields_to_values(self, fields):
-        return (fields.email, '*' * 8, fields.website)
\ No newline at end of file
+        return (fields.email, '*' * 8, fields.website)
+
+    def _searchable_fields(self, name, values):
+        email, _, website = values
+        return (name, email, website)
\ No newline at end of file
@@ -0,0 +1,133 @@
+from tkinter import ttk
+
+from ui.table_view import TableView
+
+
+class VirtualTableView(TableView):
+    ROW_HEIGHT = 20 # fallback when the theme does not define one
+    WHEEL_STEP = 3
+
+    def __init__(self, parent, db, func_decipher_private=None, on_select=None, height=20):
+        self.offset = 0
+        self.row_count = 0
+        self.page_size = height
+        self.search_tokens = ()
+        self._yscrollcommand = None
+        super().__init__(parent, db, func_decipher_private, on_select)
+        self.bind("<Configure>", self._on_configure)
+        self.bind("<MouseWheel>", lambda event: self._on_wheel(-self.WHEEL_STEP if event.delta > 0 else self.WHEEL_STEP))
+        self.bind("<Button-4>", lambda event: self._on_wheel(-self.WHEEL_STEP))
+        self.bind("<Button-5>", lambda event: self._on_wheel(self.WHEEL_STEP))
+        self.bind("<Up>", lambda event: self._on_arrow(-1))
+        self.bind("<Down>", lambda event: self._on_arrow(1))
+        self.bind("<Prior>", lambda event: self._on_wheel(-self.page_size))
+        self.bind("<Next>", lambda event: self._on_wheel(self.page_size))
+
+    # only the rows of the current window live in the treeview, everything else stays in the database
+    def populate(self):
+        self.refresh(recount=True)
+
+    def refresh(self, recount=False):
+        if recount:
+            self.row_count = self.db.count(self.search_tokens)
+        self.offset = max(0, min(self.offset, self.row_count - self.page_size))
+        rows = self.db.fetch_page(self.offset, self.page_size, self.search_tokens)
+        ttk.Treeview.delete(self, *self.get_children())
+        for fields in rows:
+            ttk.Treeview.insert(self, "", "end", fields.name, text=fields.name, values=self._fields_to_values(fields))
+        if self._last_selected is not None and self.exists(self._last_selected):
+            self.selection_set(self._last_selected)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        if self._yscrollcommand is not None:
+            self._yscrollcommand(*self.yview())
+
+    def configure(self, cnf=None, **kw):
+        if 'yscrollcommand' in kw:
+            self._yscrollcommand = kw.pop('yscrollcommand')
+            self._update_scrollbar()
+        return super().configure(cnf, **kw)
+
+    config = configure
+
+    def yview(self, *args):
+        if not args:
+            if not self.row_count:
+                return 0.0, 1.0
+            return self.offset / self.row_count, min(1.0, (self.offset + self.page_size) / self.row_count)
+        if args[0] == 'moveto':
+            self.scroll_to(round(float(args[1]) * self.row_count))
+        elif args[0] == 'scroll':
+            step = self.page_size if args[2] == 'pages' else 1
+            self.scroll_to(self.offset + int(args[1]) * step)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, self.row_count - self.page_size))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def _on_wheel(self, rows):
+        self.scroll_to(self.offset + rows)
+        return "break"
+
+    def _on_arrow(self, delta):
+        children = self.get_children()
+        name = self.get_selected_name()
+        if name not in children or 0 <= children.index(name) + delta < len(children):
+            return None # the treeview moves the selection within the window by itself
+        self.scroll_to(self.offset + delta)
+        children = self.get_children()
+        if children:
+            target = children[0] if delta < 0 else children[-1]
+            self.selection_set(target)
+            self.focus(target)
+        return "break"
+
+    def _on_configure(self, event):
+        style_height = ttk.Style(self).lookup('Treeview', 'rowheight')
+        row_height = int(style_height) if style_height else self.ROW_HEIGHT
+        page_size = max(1, event.height // row_height - 1) # minus the heading
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.refresh()
+
+    def _on_treeview_select(self, event):
+        name = self.get_selected_name()
+        if name == self._last_selected:
+            return # selection restored after the window moved
+        if name is None and self._last_selected is not None and not self.exists(self._last_selected):
+            return # the selected row just scrolled out of the window
+        super()._on_treeview_select(event)
+
+    def selection_clear(self):
+        self._last_selected = None
+        super().selection_clear()
+
+    def filter_by_search_string(self, search_string):
+        self.search_tokens = tuple(sorted(set(search_string.split())))
+        self.offset = 0
+        self.refresh(recount=True)
+
+    def prepend(self, fields):
+        self.offset = 0
+        self.refresh(recount=True)
+        if self.exists(fields.name):
+            self.focus(fields.name)
+            self.selection_set(fields.name)
+
+    def delete(self, *items):
+        if self._last_selected in items:
+            self._last_selected = None
+        self.refresh(recount=True)
+
+    def update_fields(self, fields):
+        if self.exists(fields.name):
+            self.item(fields.name, values=self._fields_to_values(fields))
+
+    def update_many(self, rows):
+        self.refresh()
+
+    def import_rows(self, report):
+        self.refresh(recount=True)